@@ -5,87 +5,104 @@
 
 # by Philip Guo
 
+# From Python, load this with daikon_io.LoadScript('analyze-comp-file')
+# and call AnalyzeCompFile().
+
 import re
 
 pptNameRE = re.compile(':::')
 
 import sys
+from daikon_io import MappedLines
 
-f = open(sys.argv[1], 'r')
-allLines = [line.strip() for line in f.readlines()]
-
+# Returns a map (pptInfoDict) for the .comp file f (a path or a file
+# object) where:
 # Key: program point name
 # Value: a list where each element is the size of a comparability set
 #        for that ppt
-pptInfoDict = {}
+def ReadCompSetSizes(f):
+    pptInfoDict = {}
 
-# The current program point we are analyzing
-curPpt = None
+    # The current program point we are analyzing
+    curPpt = None
 
-# Initialize this to an empty list and append on the size of the
-# comparability sets for each line you encounter in the program point
-curPptSetSizes = []
+    # Initialize this to an empty list and append on the size of the
+    # comparability sets for each line you encounter in the program point
+    curPptSetSizes = []
 
-# Initialize pptInfoDict
-for line in allLines:
-    # We hit a program point name, so calculate stuff
-    # for the previous program point
-    if pptNameRE.search(line):
+    # Initialize pptInfoDict
+    for line in MappedLines(f):
+        line = line.strip()
 
-        # Special case for the first program point reached
-        if not curPpt:
-            curPpt = line
+        # We hit a program point name, so calculate stuff
+        # for the previous program point
+        if pptNameRE.search(line):
 
-        # Normally, throw all of the data about the previous program
-        # point into pptInfoDict and update curPpt
-        else:
-            pptInfoDict[curPpt] = curPptSetSizes
-            curPpt = line
+            # Special case for the first program point reached
+            if not curPpt:
+                curPpt = line
+
+            # Normally, throw all of the data about the previous program
+            # point into pptInfoDict and update curPpt
+            else:
+                pptInfoDict[curPpt] = curPptSetSizes
+                curPpt = line
+
+            curPptSetSizes = []
 
-        curPptSetSizes = []
 
+        # (Ignore blank lines) ... we hit a space-delimited list of
+        # comparable variables
+        elif line:
+            # Size of comparability set for that line (mostly gonna be 1)
+            curPptSetSizes.append(len(line.split()))
 
-    # (Ignore blank lines) ... we hit a space-delimited list of
-    # comparable variables
-    elif line:
-        # Size of comparability set for that line (mostly gonna be 1)
-        curPptSetSizes.append(len(line.split()))
+    return pptInfoDict
 
 
 # Now pptInfoDict should be initialized with all numerical data.
 # We can now crunch numbers and produce useful-looking results
+def AnalyzeCompFile(f, out):
+    pptInfoDict = ReadCompSetSizes(f)
 
-sumOfAvgs = 0
-numPpts = len(pptInfoDict.keys())
+    sumOfAvgs = 0
+    numPpts = len(pptInfoDict.keys())
 
-totalSquareVars = 0;
-totalVars = 0
+    totalSquareVars = 0;
+    totalVars = 0
+
+    totalSquareVarsNoComp = 0
+
+    for ppt in pptInfoDict:
+        compSetSizesAtPpt = pptInfoDict[ppt]
+        totalVarsAtPpt = sum(compSetSizesAtPpt)
+        squareVarsAtPpt = sum([(i*i) for i in compSetSizesAtPpt])
+
+        if totalVarsAtPpt > 0:
+            avgForPpt = float(squareVarsAtPpt) / float(totalVarsAtPpt)
+        else:
+            avgForPpt = 0
 
-totalSquareVarsNoComp = 0
+        sumOfAvgs += avgForPpt
 
-for ppt in pptInfoDict:
-    compSetSizesAtPpt = pptInfoDict[ppt]
-    totalVarsAtPpt = sum(compSetSizesAtPpt)
-    squareVarsAtPpt = sum([(i*i) for i in compSetSizesAtPpt])
+        totalSquareVars += squareVarsAtPpt
+        totalVars += totalVarsAtPpt
 
-    if totalVarsAtPpt > 0:
-        avgForPpt = float(squareVarsAtPpt) / float(totalVarsAtPpt)
-    else:
-        avgForPpt = 0
+        totalSquareVarsNoComp += (totalVarsAtPpt * totalVarsAtPpt)
 
-    sumOfAvgs += avgForPpt
+#        print ppt
+#        print "Total # vars:     ", totalVarsAtPpt
+#        print "Average set size: ", avgForPpt
 
-    totalSquareVars += squareVarsAtPpt
-    totalVars += totalVarsAtPpt
 
-    totalSquareVarsNoComp += (totalVarsAtPpt * totalVarsAtPpt)
+#    print
+#    print "Unweighted average:", ((sumOfAvgs) / float(numPpts))
+    print >> out, "Weighted average:", (float(totalSquareVars) / float(totalVars))
+    print >> out, "Avg. (No comparability):", (float(totalSquareVarsNoComp) / float(totalVars))
 
-#    print ppt
-#    print "Total # vars:     ", totalVarsAtPpt
-#    print "Average set size: ", avgForPpt
 
+def main(argv):
+    AnalyzeCompFile(argv[1], sys.stdout)
 
-#print
-#print "Unweighted average:", ((sumOfAvgs) / float(numPpts))
-print "Weighted average:", (float(totalSquareVars) / float(totalVars))
-print "Avg. (No comparability):", (float(totalSquareVarsNoComp) / float(totalVars))
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,339 @@
+#!/usr/bin/python
+
+# Compares the comparability sets in two .comp files (as generated by
+# decls2comp.py) structurally rather than textually, and reports which
+# program points had their sets split, merged or moved around.  This
+# helps out with checking DynComp regression test results.
+
+# Usage: ./comp-diff.py [--summary] old.comp new.comp
+# Either input may also be a .decls file with comparability numbers,
+# in which case it is run through decls2comp.py first.  Inputs may be
+# compressed with gzip, bzip2 or xz (e.g. foo.decls.gz).
+# --summary only prints the final summary line.
+# Exits with status 0 if the files are equivalent and 1 otherwise.
+# From Python, load this with daikon_io.LoadScript('comp-diff') and
+# call DiffComp().
+
+# Duplicate program points, which decls2comp.py renames to 'name (1)',
+# 'name (2)', ..., are matched up by their contents rather than by
+# their numbers, so renumbering them is not reported as a difference.
+# An entry written by decls2comp.py --dedup as 'name (xN)' counts as N
+# copies of that program point.
+
+# Both inputs are sorted by program point name, so they are read in
+# lock step, one program point name at a time.  Only the comparability
+# sets of the current program point are held in memory.  This does not
+# hold for a .decls input: decls2comp.py has to read all of its
+# program points to sort them, so their sets are all in memory until
+# the comparison is done.  To compare very large .decls files in
+# bounded memory, convert them with decls2comp.py first.
+
+# For each pair of program points, each set is put into a connected
+# component with all of the sets from the other file that it shares a
+# variable with.  A component made of:
+#   1 old set and 1 new set is unchanged,
+#   1 old set and several new sets is a split,
+#   several old sets and 1 new set is a merge,
+#   several old sets and several new sets means variables moved.
+# The similarity score is the Jaccard index of the pairs of variables
+# that are comparable in the two files (1.0 means identical sets).
+
+import sys
+import re
+from daikon_io import MappedLines, LoadScript
+
+DupSuffixRE = re.compile(' \(\d+\)$')
+DedupCountRE = re.compile(' \(x(\d+)\)$')
+DeclsNameRE = re.compile('\.decls(\.gz|\.bz2|\.xz)?$')
+
+# Yields a (program point name, partition) pair for each program point
+# in a .comp file, where partition is a frozenset of comparability sets
+# and each set is a frozenset of variable names
+def ReadComp(f):
+    pptName = None
+    compSets = None
+
+    for line in f:
+        line = line.strip()
+
+        if pptName is None:
+            if line:
+                pptName = line
+                compSets = []
+        elif line:
+            compSets.append(frozenset(line.split()))
+        else:
+            # Blank line ends this ppt
+            yield (pptName, frozenset(compSets))
+            pptName = None
+
+    if pptName is not None:
+        yield (pptName, frozenset(compSets))
+
+# Groups consecutive program points that only differ in their
+# duplicate suffix and yields a (base name, [partition, ...]) pair for
+# each group
+def ReadGroups(f):
+    curBase = None
+    partitions = []
+
+    for (pptName, partition) in ReadComp(f):
+        count = 1
+        countMatch = DedupCountRE.search(pptName)
+        if countMatch:
+            count = int(countMatch.group(1))
+            pptName = pptName[:countMatch.start()]
+
+        base = DupSuffixRE.sub('', pptName)
+        if base != curBase:
+            if curBase is not None:
+                yield (curBase, partitions)
+            curBase = base
+            partitions = []
+        partitions.extend([partition] * count)
+
+    if curBase is not None:
+        yield (curBase, partitions)
+
+# Yields the lines of the output of decls2comp.py for the .decls file f
+# (run in this process), as they are produced.  (All of the program
+# points of f are read before the first line, see above.)
+def DeclsCompLines(f):
+    for entry in LoadScript('decls2comp').CompEntries(f):
+        for line in entry.split('\n'):
+            yield line
+
+# Returns the lines of a .comp file (a path or a file object), or of
+# the output of decls2comp.py for a .decls file
+def OpenComp(f):
+    if DeclsNameRE.search(getattr(f, 'name', f)):
+        return DeclsCompLines(f)
+    else:
+        return MappedLines(f)
+
+
+def Pairs(n):
+    return n * (n - 1) // 2
+
+def FormatSet(compSet):
+    return '{' + ' '.join(sorted(compSet)) + '}'
+
+# Compares two partitions of (possibly different) sets of variables.
+# Returns a tuple of
+#  (list of (kind, old sets, new sets) for each changed component,
+#   variables only in old, variables only in new,
+#   # of pairs comparable in both, # of pairs comparable in either)
+def ComparePartitions(oldPartition, newPartition):
+    oldAll = frozenset().union(*oldPartition)
+    newAll = frozenset().union(*newPartition)
+    onlyOld = sorted(oldAll - newAll)
+    onlyNew = sorted(newAll - oldAll)
+
+    # Key: shared variable name, Value: its set in old (or new),
+    # restricted to the shared variables
+    oldVars = {}
+    for compSet in oldPartition:
+        restricted = compSet & newAll
+        for var in restricted:
+            oldVars[var] = ('o', restricted)
+    newVars = {}
+    for compSet in newPartition:
+        restricted = compSet & oldAll
+        for var in restricted:
+            newVars[var] = ('n', restricted)
+
+    # Union-find over sets, where old sets are keyed by ('o', set) and
+    # new sets by ('n', set), joined through the variables they share
+    parent = {}
+    def Find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    # Key: (old set, new set), Value: # of shared variables
+    overlaps = {}
+    for var in oldVars:
+        oldSet = oldVars[var]
+        newSet = newVars[var]
+        parent.setdefault(oldSet, oldSet)
+        parent.setdefault(newSet, newSet)
+        parent[Find(oldSet)] = Find(newSet)
+        key = (oldSet, newSet)
+        overlaps[key] = overlaps.get(key, 0) + 1
+
+    # Key: component root, Value: [old sets, new sets]
+    components = {}
+    for compSet in parent.keys():
+        entry = components.setdefault(Find(compSet), ([], []))
+        if compSet[0] == 'o':
+            entry[0].append(compSet[1])
+        else:
+            entry[1].append(compSet[1])
+
+    changes = []
+    for (oldSets, newSets) in components.values():
+        if len(oldSets) == 1 and len(newSets) == 1:
+            continue
+        elif len(oldSets) == 1:
+            kind = 'split'
+        elif len(newSets) == 1:
+            kind = 'merged'
+        else:
+            kind = 'moved'
+        changes.append((kind,
+                        sorted([FormatSet(s) for s in oldSets]),
+                        sorted([FormatSet(s) for s in newSets])))
+    changes.sort()
+
+    # Pair counts are over the shared variables only
+    bothPairs = sum([Pairs(n) for n in overlaps.values()])
+    oldPairs = sum([Pairs(len(s[1])) for s in parent if s[0] == 'o'])
+    newPairs = sum([Pairs(len(s[1])) for s in parent if s[0] == 'n'])
+    eitherPairs = oldPairs + newPairs - bothPairs
+
+    return (changes, onlyOld, onlyNew, bothPairs, eitherPairs)
+
+
+# Keeps the running totals for one comparison of two .comp files and
+# reports each difference to out as it is found
+class CompDiff(object):
+    def __init__(self, out, quiet=False):
+        self.out = out
+        self.quiet = quiet
+
+        self.numCompared = 0
+        self.numIdentical = 0
+        self.numDiffering = 0
+        self.numOnlyOld = 0
+        self.numOnlyNew = 0
+        self.totalBothPairs = 0
+        self.totalEitherPairs = 0
+
+    def Report(self, pptName, message):
+        if not self.quiet:
+            self.out.write(pptName + ': ' + message + '\n')
+
+    # Compares the partitions of all program points with the same name.
+    # Identical partitions are matched up first via their hashes, no
+    # matter what duplicate suffix they had.  The leftovers are paired
+    # up in order and compared set by set.
+    def CompareGroup(self, base, oldPartitions, newPartitions):
+        # Key: partition, Value: # of unmatched copies of it in new
+        newCounts = {}
+        for partition in newPartitions:
+            newCounts[partition] = newCounts.get(partition, 0) + 1
+
+        oldLeft = []
+        for partition in oldPartitions:
+            if newCounts.get(partition, 0) > 0:
+                newCounts[partition] -= 1
+                self.numCompared += 1
+                self.numIdentical += 1
+                # Identical sets agree on all of their pairs
+                n = sum([Pairs(len(s)) for s in partition])
+                self.totalBothPairs += n
+                self.totalEitherPairs += n
+            else:
+                oldLeft.append(partition)
+
+        newLeft = []
+        for partition in newPartitions:
+            if newCounts.get(partition, 0) > 0:
+                newCounts[partition] -= 1
+                newLeft.append(partition)
+
+        for i in range(min(len(oldLeft), len(newLeft))):
+            self.numCompared += 1
+            self.numDiffering += 1
+            (changes, onlyOld, onlyNew, bothPairs, eitherPairs) = \
+                ComparePartitions(oldLeft[i], newLeft[i])
+            self.totalBothPairs += bothPairs
+            self.totalEitherPairs += eitherPairs
+
+            if eitherPairs:
+                similarity = float(bothPairs) / eitherPairs
+            else:
+                similarity = 1.0
+            self.Report(base, 'similarity %.4f' % similarity)
+            for (kind, oldSets, newSets) in changes:
+                self.Report(base, '%s %s -> %s' % (kind, ' '.join(oldSets), ' '.join(newSets)))
+            if onlyOld:
+                self.Report(base, 'variables only in old: ' + ' '.join(onlyOld))
+            if onlyNew:
+                self.Report(base, 'variables only in new: ' + ' '.join(onlyNew))
+
+        for partition in oldLeft[len(newLeft):]:
+            self.numOnlyOld += 1
+            self.Report(base, 'only in old')
+        for partition in newLeft[len(oldLeft):]:
+            self.numOnlyNew += 1
+            self.Report(base, 'only in new')
+
+    def Summary(self):
+        if self.totalEitherPairs:
+            totalSimilarity = float(self.totalBothPairs) / self.totalEitherPairs
+        else:
+            totalSimilarity = 1.0
+
+        return ('Compared %d ppts: %d identical, %d differ, %d only in old, '
+                '%d only in new; similarity %.4f'
+                % (self.numCompared, self.numIdentical, self.numDiffering,
+                   self.numOnlyOld, self.numOnlyNew, totalSimilarity))
+
+    def Differs(self):
+        return bool(self.numDiffering or self.numOnlyOld or self.numOnlyNew)
+
+
+# Compares the .comp (or .decls) files oldFile and newFile (paths or
+# file objects), writes the differences and the summary line to out,
+# and returns the CompDiff with the totals
+def DiffComp(oldFile, newFile, out, quiet=False):
+    diff = CompDiff(out, quiet)
+
+    oldGroups = ReadGroups(OpenComp(oldFile))
+    newGroups = ReadGroups(OpenComp(newFile))
+
+    oldGroup = next(oldGroups, None)
+    newGroup = next(newGroups, None)
+
+    # Merge the two sorted streams of program point groups
+    while oldGroup is not None or newGroup is not None:
+        if newGroup is None or (oldGroup is not None and oldGroup[0] < newGroup[0]):
+            diff.CompareGroup(oldGroup[0], oldGroup[1], [])
+            oldGroup = next(oldGroups, None)
+        elif oldGroup is None or newGroup[0] < oldGroup[0]:
+            diff.CompareGroup(newGroup[0], [], newGroup[1])
+            newGroup = next(newGroups, None)
+        else:
+            diff.CompareGroup(oldGroup[0], oldGroup[1], newGroup[1])
+            oldGroup = next(oldGroups, None)
+            newGroup = next(newGroups, None)
+
+    out.write(diff.Summary() + '\n')
+    return diff
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(
+        usage="comp-diff.py [--summary] old.comp new.comp",
+        epilog="Either input may be a .decls file instead of a .comp file.  "
+               ".comp inputs are compared in bounded memory, but a .decls "
+               "input is held in memory in full (decls2comp.py has to sort "
+               "its program points), so convert very large .decls files "
+               "with decls2comp.py first.")
+    parser.add_argument('oldFile', help="old .comp or .decls file")
+    parser.add_argument('newFile', help="new .comp or .decls file")
+    parser.add_argument('--summary', action='store_true',
+                        help="only print the summary line")
+    args = parser.parse_args(argv[1:])
+
+    if DiffComp(args.oldFile, args.newFile, sys.stdout, args.summary).Differs():
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
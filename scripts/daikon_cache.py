@@ -0,0 +1,235 @@
+# A cache of parsed .decls files shared by the Python scripts in this
+# directory, so that a large .decls file only has to be parsed once
+# as long as it does not change.
+
+# The cache is a directory with two kinds of files:
+#  path-<digest of the absolute path>.marshal
+#    (size, mtime, content digest) of the file at that path when it
+#    was last read
+#  decls-<content digest>-<intermediate>.marshal
+#    the parsed program points of a file with that content, one marshal
+#    record per program point, so that they can be read back one at a
+#    time
+# The size and mtime of the input are checked on every read; if either
+# of them changed, the content is hashed again, so a file that was only
+# touched (or copied) still uses its cached program points, and one
+# that was edited is parsed again.  Entries are written with marshal to
+# a temporary file and renamed into place, so concurrent runs never
+# read a partial entry.  A program point entry is written while the
+# file is parsed, and only memory for one program point at a time is
+# needed to write or read it.
+
+# The directory is kept under a size limit by deleting the entries
+# that were used least recently (each use touches the entry) whenever
+# a new one is added.
+
+# From Python, call CachedDecls() in place of
+# daikon_format.ReadDecls(daikon_io.MappedLines(f)).
+
+import os
+import marshal
+import itertools
+import hashlib
+from daikon_io import MappedLines
+from daikon_format import ReadDecls, Ppt, Variable
+
+CACHE_VERSION = "daikon-decls-cache-2"
+
+# Default limit on the total size of the cache directory
+MAX_CACHE_BYTES = 256 << 20
+
+# The cache directory that scripts use when --decls-cache is not given
+# (if the variable is not set, nothing is cached)
+CACHE_DIR_VARIABLE = 'DAIKON_DECLS_CACHE'
+
+HASH_BLOCK_SIZE = 1 << 20
+
+def DefaultCacheDir():
+    return os.environ.get(CACHE_DIR_VARIABLE) or None
+
+# Returns the hex digest of the (raw, possibly compressed) contents of
+# the file at path
+def FileDigest(path):
+    digest = hashlib.md5()
+    f = open(path, 'rb')
+    try:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+# Returns the contents of the entry at path, or None if it is missing,
+# unreadable or from another version of the cache
+def LoadEntry(path):
+    try:
+        f = open(path, 'rb')
+        try:
+            entry = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(entry, tuple) or len(entry) != 2 or entry[0] != CACHE_VERSION:
+        return None
+    return entry[1]
+
+def SaveEntry(path, value):
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    f = open(tmpPath, 'wb')
+    try:
+        marshal.dump((CACHE_VERSION, value), f)
+    finally:
+        f.close()
+    os.rename(tmpPath, path)
+
+# Marks an entry as recently used
+def TouchEntry(path):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+# Deletes the least recently used entries in cacheDir until the total
+# size of the entries is at most maxBytes
+def EvictEntries(cacheDir, maxBytes=MAX_CACHE_BYTES):
+    entries = []
+    total = 0
+    for name in os.listdir(cacheDir):
+        if not name.endswith('.marshal'):
+            continue
+        path = os.path.join(cacheDir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    entries.sort()
+    for (mtime, size, path) in entries:
+        if total <= maxBytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+# Returns the content digest of the file at path, using the one
+# recorded in the cache if its size and mtime have not changed
+def CachedDigest(cacheDir, path):
+    st = os.stat(path)
+    absPath = os.path.abspath(path)
+    entryPath = os.path.join(cacheDir, 'path-%s.marshal' % hashlib.md5(absPath).hexdigest())
+
+    entry = LoadEntry(entryPath)
+    if entry is not None and entry[0] == absPath and entry[1] == st.st_size and entry[2] == st.st_mtime:
+        TouchEntry(entryPath)
+        return entry[3]
+
+    digest = FileDigest(path)
+    SaveEntry(entryPath, (absPath, st.st_size, st.st_mtime, digest))
+    return digest
+
+# Program points are stored as (name, [(name, decType, repType, comp),
+# ...]) tuples, which marshal can write
+def PackPpt(ppt):
+    return (ppt.name, [(var.name, var.decType, var.repType, var.comp)
+                       for var in ppt.vars])
+
+def UnpackPpt(packed):
+    return Ppt(packed[0], [Variable(*var) for var in packed[1]])
+
+# Returns the program point entry at path, opened and positioned at its
+# first program point, or None if it is missing or from another version
+# of the cache
+def OpenPptEntry(path):
+    try:
+        entryF = open(path, 'rb')
+    except (IOError, OSError):
+        return None
+    try:
+        version = marshal.load(entryF)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        version = None
+    if version != CACHE_VERSION:
+        entryF.close()
+        return None
+    return entryF
+
+# Yields the program points of the open entry entryF, which ends with a
+# None record.  If the entry turns out to be damaged, the rest of the
+# program points are parsed from f instead.
+def LoadPpts(entryF, f, intermediate):
+    numPpts = 0
+    try:
+        try:
+            while True:
+                packed = marshal.load(entryF)
+                if packed is None:
+                    return
+                yield UnpackPpt(packed)
+                numPpts += 1
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            pass
+    finally:
+        entryF.close()
+
+    for ppt in itertools.islice(ReadDecls(MappedLines(f), intermediate), numPpts, None):
+        yield ppt
+
+# Yields the program points ppts and saves them as the entry at
+# entryPath once they have all been yielded
+def SavePpts(ppts, entryPath, cacheDir, maxBytes):
+    tmpPath = '%s.%d.tmp' % (entryPath, os.getpid())
+    entryF = open(tmpPath, 'wb')
+    complete = False
+    try:
+        marshal.dump(CACHE_VERSION, entryF)
+        for ppt in ppts:
+            marshal.dump(PackPpt(ppt), entryF)
+            yield ppt
+        marshal.dump(None, entryF)
+        complete = True
+    finally:
+        entryF.close()
+        # (If the reader stopped early, there is nothing to save)
+        if not complete:
+            try:
+                os.remove(tmpPath)
+            except OSError:
+                pass
+
+    os.rename(tmpPath, entryPath)
+    EvictEntries(cacheDir, maxBytes)
+
+# Returns the program points of the .decls file f like
+# ReadDecls(MappedLines(f), intermediate), but out of cacheDir if f was
+# parsed before.  If cacheDir is None, or f is not a regular file (a
+# file object or a pipe), f is parsed without the cache.  Either way
+# the program points are produced one at a time.
+def CachedDecls(f, intermediate=True, cacheDir=None, maxBytes=MAX_CACHE_BYTES):
+    if cacheDir is None or not isinstance(f, basestring) or not os.path.isfile(f):
+        return ReadDecls(MappedLines(f), intermediate)
+
+    if not os.path.isdir(cacheDir):
+        try:
+            os.makedirs(cacheDir)
+        except OSError:
+            # (Another run may have just created it)
+            if not os.path.isdir(cacheDir):
+                raise
+
+    digest = CachedDigest(cacheDir, f)
+    entryPath = os.path.join(cacheDir, 'decls-%s-%d.marshal' % (digest, bool(intermediate)))
+
+    entryF = OpenPptEntry(entryPath)
+    if entryF is not None:
+        TouchEntry(entryPath)
+        return LoadPpts(entryF, f, intermediate)
+
+    return SavePpts(ReadDecls(MappedLines(f), intermediate), entryPath, cacheDir, maxBytes)
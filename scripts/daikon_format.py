@@ -0,0 +1,386 @@
+# Shared parsers for the Daikon file formats that the Python scripts in
+# this directory work with, along with the Dfec/Kvasir name conversion
+# routines that used to be copied from script to script.
+
+# Reads:
+#  .decls files in the old format ('DECLARE' followed by 4 lines per
+#  variable) and in the decls 2.0 format ('ppt' and 'variable' records)
+#  .dtrace files, one record at a time
+
+# All of the readers take an iterable of lines (or, for .dtrace files,
+# of records), such as those from daikon_io.MappedLines() and
+# daikon_io.MappedRecords(), so they never need the whole file.
+
+import re
+import itertools
+
+
+# A variable declared at a program point.  Any of the fields after the
+# name may be None if the declaration did not include it.
+class Variable(object):
+    __slots__ = ('name', 'decType', 'repType', 'comp')
+
+    def __init__(self, name, decType=None, repType=None, comp=None):
+        self.name = name
+        self.decType = decType
+        self.repType = repType
+        self.comp = comp
+
+# A program point declaration: its full name and a list of Variables in
+# declaration order
+class Ppt(object):
+    __slots__ = ('name', 'vars')
+
+    def __init__(self, name, vars):
+        self.name = name
+        self.vars = vars
+
+
+# Versions of the .decls format, as detected from the file header
+DECLS_V1 = 1 # 'DECLARE' followed by 4 lines per variable
+DECLS_V2 = 2 # 'decl-version 2.0', 'ppt' and 'variable' records
+
+PPT_START = "ppt "
+
+def IsDeclare(line):
+    return line == "DECLARE" or line == "INTERMEDIATE DECLARE"
+
+# Returns True if the stripped line starts a program point
+def IsPptLine(line, version):
+    if version == DECLS_V1:
+        return IsDeclare(line)
+    else:
+        return line[0:len(PPT_START)] == PPT_START
+
+# Figures out the version of the .decls format from the header of f.
+# Returns a (version, lines) pair, where lines yields every line of f
+# that has not been consumed by the header check.
+def DetectVersion(f):
+    lines = iter(f)
+    for line in lines:
+        stripped = line.strip()
+        if IsDeclare(stripped):
+            return (DECLS_V1, itertools.chain([line], lines))
+        elif (stripped[0:len("decl-version ")] == "decl-version " or
+              stripped[0:len(PPT_START)] == PPT_START):
+            return (DECLS_V2, itertools.chain([line], lines))
+    return (DECLS_V2, lines)
+
+# Reads a .decls file one line at a time and yields a
+# (program point name, block) pair for each program point, where block
+# is the list of stripped lines that follow its name, minus blank
+# lines and comments.  Only the block of the program point currently
+# being read is ever held in memory.
+# If intermediate is False, the program points of "INTERMEDIATE DECLARE"
+# statements (from Kvasir's --dyncomp-print-inc option) are skipped.
+def ReadPptBlocks(lines, version, intermediate=True):
+    if version == DECLS_V1:
+        return ReadPptBlocksV1(lines, intermediate)
+    else:
+        return ReadPptBlocksV2(lines)
+
+def ReadPptBlocksV2(lines):
+    pptName = None
+    block = None
+
+    for line in lines:
+        line = line.strip()
+
+        if line[0:len(PPT_START)] == PPT_START:
+            if pptName is not None:
+                yield (pptName, block)
+            pptName = line[len(PPT_START):]
+            block = []
+        elif pptName is None or line == "" or line[0] == "#":
+            # Skip the header, blank lines & comments
+            continue
+        else:
+            block.append(line)
+
+    if pptName is not None:
+        yield (pptName, block)
+
+# Program points are separated by "DECLARE" statements, and the
+# program point name is the first line after that
+def ReadPptBlocksV1(lines, intermediate=True):
+    inPpt = False
+    pptName = None
+    block = None
+
+    for line in lines:
+        line = line.strip()
+
+        if IsDeclare(line):
+            if pptName is not None:
+                yield (pptName, block)
+            inPpt = intermediate or line == "DECLARE"
+            pptName = None
+            block = []
+        elif not inPpt or line == "" or line[0] == "#":
+            # Skip the header, blank lines & comments
+            continue
+        elif pptName is None:
+            pptName = line
+        else:
+            block.append(line)
+
+    if pptName is not None:
+        yield (pptName, block)
+
+
+# All info. about variables at a program point come in sets of 4
+# lines. e.g.
+#
+# a
+# int # isParam=true
+# int
+# 1
+def ParseVarsV1(block):
+    return [Variable(block[i], block[i+1], block[i+2], block[i+3])
+            for i in range(0, len(block) - 3, 4)]
+
+# The decls 2.0 variable records that matter here, keyed by their
+# first KEYWORD_WIDTH characters (which are unique among decls 2.0
+# keywords), with a value of (the Variable field it sets, length of
+# the keyword).  One dict lookup per line replaces a chain of prefix
+# comparisons; all other records (var-kind, flags, ...) miss and are
+# skipped.
+KEYWORD_WIDTH = len("variable ")
+V2_KEYWORDS = {}
+for (keyword, field) in [("variable ", 'name'),
+                         ("dec-type ", 'decType'),
+                         ("rep-type ", 'repType'),
+                         ("comparability ", 'comp')]:
+    V2_KEYWORDS[keyword[:KEYWORD_WIDTH]] = (field, len(keyword))
+
+def ParseVarsV2(block):
+    vars = []
+    curVar = None
+
+    lookup = V2_KEYWORDS.get
+    for line in block:
+        entry = lookup(line[:KEYWORD_WIDTH])
+        if entry is None:
+            continue
+
+        field, start = entry
+        if field == 'name':
+            curVar = Variable(line[start:])
+            vars.append(curVar)
+        elif curVar is not None:
+            # (Records before the first variable belong to the ppt)
+            setattr(curVar, field, line[start:])
+
+    return vars
+
+# Turns the block of a program point into a list of Variables
+def ParseVars(block, version):
+    if version == DECLS_V1:
+        return ParseVarsV1(block)
+    else:
+        return ParseVarsV2(block)
+
+# Yields a Ppt for each program point declared in a .decls file (of
+# either format), in file order
+def ReadDecls(f, intermediate=True):
+    version, lines = DetectVersion(f)
+    for (pptName, block) in ReadPptBlocks(lines, version, intermediate):
+        yield Ppt(pptName, ParseVars(block, version))
+
+
+# The variable that pairs up the ENTER and EXIT records of a call
+NONCE_NAME = "this_invocation_nonce"
+
+# Returns True if line names the program point of a .dtrace record
+def IsSamplePptName(line):
+    return ':::ENTER' in line or ':::EXIT' in line
+
+# Yields a (program point name, nonce, fields) tuple for each record of
+# a .dtrace file, where fields is a list of the unstripped lines of the
+# record after the program point name and nonce, 3 per variable:
+# variable name
+# value
+# modbit
+# The program point name is the first line of the record that names an
+# :::ENTER or :::EXIT program point, and records that don't have one
+# (such as the header) are skipped.  nonce is None if the record
+# doesn't have a this_invocation_nonce.
+def ReadDtrace(records):
+    for record in records:
+        numLines = len(record)
+
+        i = 0
+        pptName = None
+        while i < numLines:
+            line = record[i].strip()
+            i += 1
+            if IsSamplePptName(line):
+                pptName = line
+                break
+
+        if pptName is None:
+            continue
+
+        nonce = None
+        if i < numLines and record[i].strip() == NONCE_NAME:
+            if i + 1 < numLines:
+                nonce = record[i+1].strip()
+            i += 2
+
+        yield (pptName, nonce, record[i:])
+
+
+DfecGlobalRE = re.compile('^::')
+
+# Dfec and Kvasir variable differences:
+
+# Globals are prefixed with a '::' in Dfec
+# and with a '/' in Kvasir
+
+# Dfec doesn't append the filename in front of
+# file-static global variables like Kvasir does
+
+# Dfec also doesn't print out function-static variables
+# while Kvasir does
+
+# Dfec derives two Daikon variables for strings
+# one for the pointer and the other for the contents,
+# while Kvasir only has one for the contents.
+
+# Dfec uses the arrow notation for struct names while
+# Kvasir uses the bracket notation (unless disambiguation
+# information is provided)
+
+# Converts variable var's name from Dfec conventions
+# to Kvasir conventions and returns it as the result
+def ConvertDfecVarName(var):
+    globalConverted = DfecGlobalRE.sub('/', var)
+    return globalConverted.replace('->', '[].')
+
+# Ok, we are going to just strip off everything before
+# the '/', if there is one, because Dfec does not print
+# out the function name for function-static variables
+# e.g. 'flex_c@epsclosure/did_stk_init' becomes '/did_stk_init'
+def ConvertKvasirVarName(var):
+    if var[0] == '/':
+        return var
+    elif '/' in var:
+        return '/' + var.split('/')[1]
+    else:
+        return var
+
+# Kvasir does not support comparability for array indices
+# so strip those off.
+# e.g. '104[105]' becomes '104'
+def StripCompNumber(comp_num):
+    if '[' in comp_num:
+        return comp_num[:comp_num.find('[')]
+    else:
+        return comp_num
+
+# Strips all comments after #
+# space-delimited token:
+# Input:  int # isParam=true
+# Output: int
+def StripComments(comp_num):
+    return comp_num.split('#')[0].strip()
+
+# Dfec and Kvasir program point name differences:
+
+# Global program point names in Dfec are prefixed by 'std.'
+# while they are prefixed by '..' in Kvasir
+
+# Dfec uses 'EXIT1' while Kvasir uses 'EXIT0' for the exit
+# so we should probably simply search for 'EXIT' without
+# regard to the number behind it.  However, Dfec can have
+# more than 1 exit while Kvasir can only have 1.  Hmmm,
+# what do we do about that?
+# (By default, we just keep 'EXIT' without the number before
+#  putting it in the hashtable.  Thus, only one EXIT ppt
+#  is kept for each function.  Pass keepExitId=True to keep the
+#  number, e.g. ('ccladd', 'EXIT2'), so that the scripts can decide
+#  what to do with the other exits; see EXIT_POLICIES in
+#  dfec-to-kvasir.py)
+
+# Dfec's names for C functions have crap in between the parens
+# while Kvasir's doesn't.  Let's just not worry about what's
+# in the parens since C doesn't have overloading.  We just want
+# to strip off the canonical function name.
+
+# Strips the extraneous stuff off of Dfec's names and returns
+# a 2-tuple of ppt name and either 'ENTER' or 'EXITxxx'
+
+# Input:  'std.ccladd(int;int;)void:::ENTER'
+# Output: ('ccladd', 'ENTER')
+
+def StripDfecPptName(ppt, keepExitId=False):
+    fnname, enterOrExit = ppt.split(':::')
+    if fnname[:4] == 'std.':
+        fnname = fnname[4:]
+    # Find the first '(' and end the function name there
+    fnname = fnname[:fnname.index('(')]
+
+    # Just return 'ENTER' or 'EXIT' with no numbers
+    # (This means that we can only keep one exit ppt,
+    #  unless keepExitId is True)
+    if enterOrExit[1] == 'N':
+        enterOrExit = 'ENTER'
+    elif not keepExitId:
+        enterOrExit = 'EXIT'
+
+    # Return a pair of the function name and 'ENTER' or 'EXITxxx'
+    return (fnname, enterOrExit)
+
+
+def StripKvasirPptName(ppt, keepExitId=False):
+    fnname, enterOrExit = ppt.split(':::')
+
+    # For globals, grab everything from '..' to '('
+    # e.g. for '..main():::ENTER'
+    # we want 'main'
+    if fnname[:2] == '..':
+        fnname = fnname[2:fnname.find('(')]
+
+    # For file-static names, we need to take everything between
+    # the LAST period ('.') and the '('
+    # e.g. for 'flex.c.yy_push_state():::EXIT0',
+    # we want 'yy_push_state'
+    else:
+        fnname = fnname[fnname.rfind('.')+1:fnname.find('(')]
+
+    # Just return 'ENTER' or 'EXIT' with no numbers
+    # (This means that we can only keep one exit ppt,
+    #  unless keepExitId is True)
+    if enterOrExit[1] == 'N':
+        enterOrExit = 'ENTER'
+    elif not keepExitId:
+        enterOrExit = 'EXIT'
+
+    # Return a pair of the function name and 'ENTER' or 'EXITxxx'
+    return (fnname, enterOrExit)
+
+# Returns the program point name ppt (either Dfec's or Kvasir's) with
+# its exit replaced by exitId (e.g. 'EXIT2')
+def RenameExit(ppt, exitId):
+    return ppt[:ppt.rindex(':::') + 3] + exitId
+
+
+# Returns a list of declared type comparability numbers for a list of
+# Variables, in the same order.  All variables with identical declared
+# type strings get the same comparability number.
+def DecTypeCompNums(vars):
+    curCompNum = 1 # Start at 1 and monotonically increase
+
+    # Key: declared type; Value: comp. num associated with that type
+    decTypesMap = {}
+
+    compNums = []
+    for var in vars:
+        curDecType = StripComments(var.decType or '')
+        if curDecType in decTypesMap:
+            compNums.append(decTypesMap[curDecType]) # Use the stored comp. num
+        else:
+            compNums.append(curCompNum) # Use a fresh new comp. num
+            decTypesMap[curDecType] = curCompNum # and add the entry to the map
+            curCompNum += 1 # Don't forget to increment this!
+    return compNums
@@ -0,0 +1,539 @@
+# Shared input and output routines for the Python scripts in this
+# directory that read and write Daikon .decls, .dtrace and .comp files
+# (decls2comp.py, dfec-to-kvasir-dtrace.py, ...).
+
+# Input files are memory-mapped rather than read in with readlines(),
+# and their contents are handed out as byte string slices of the
+# mapping.  Nothing is decoded or stripped here, so each script only
+# pays for converting the fields that it actually uses.
+
+# Every routine here takes either a path or an open file object, so
+# that the scripts can also be driven from other Python code.
+
+# Inputs compressed with gzip, bzip2 or xz are recognized by their
+# magic bytes and decompressed as they are read, on a separate thread
+# so that decompression overlaps with parsing.  Outputs whose names end
+# in .gz, .bz2 or .xz are compressed.  Only the standard library is
+# used; xz needs the lzma module, which Python 2 doesn't have unless
+# the backports.lzma package is installed.
+
+import os
+import re
+import sys
+import mmap
+import itertools
+import zlib
+import bz2
+import gzip
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+def IsFile(f):
+    return hasattr(f, 'read')
+
+# Magic bytes at the start of each kind of compressed file
+COMPRESSION_MAGIC = [(b'\x1f\x8b', 'gzip'),
+                     (b'BZh', 'bz2'),
+                     (b'\xfd7zXZ\x00', 'xz')]
+MAGIC_LENGTH = 6
+
+# Returns 'gzip', 'bz2' or 'xz' if header (the first bytes of a file)
+# starts with the magic bytes of that kind of file, or else None
+def Compression(header):
+    for (magic, kind) in COMPRESSION_MAGIC:
+        if header[:len(magic)] == magic:
+            return kind
+    return None
+
+# Returns True if the file at path can be split into byte ranges for
+# worker processes, i.e. it is a regular file that isn't compressed
+def IsSplittable(path):
+    if IsFile(path) or not os.path.isfile(path):
+        return False
+    f = open(path, 'rb')
+    header = f.read(MAGIC_LENGTH)
+    f.close()
+    return Compression(header) is None
+
+# Returns a read-only memory map of the file f (a path or a file
+# object), or None if it cannot be mapped (e.g. it is empty, it is a
+# pipe, it is an in-memory file, or it is compressed)
+def MapFile(f):
+    if IsFile(f):
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError, AttributeError):
+            return None
+    else:
+        f = open(f, 'rb')
+        try:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                return None
+        finally:
+            # The map keeps its own handle on the file
+            f.close()
+
+    if Compression(mm[:MAGIC_LENGTH]) is not None:
+        mm.close()
+        return None
+    return mm
+
+
+# Size of the blocks that are read from files that can't be mapped
+BLOCK_SIZE = 1 << 20
+
+def NewDecompressor(kind):
+    if kind == 'gzip':
+        # (The extra 16 tells zlib to expect a gzip header)
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif kind == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif lzma is not None:
+        return lzma.LZMADecompressor()
+    else:
+        raise IOError("reading xz files needs the lzma module")
+
+# Returns True if decompressor has come to the end of its stream
+def StreamEnded(decompressor):
+    eof = getattr(decompressor, 'eof', None)
+    if eof is not None:
+        return eof
+    # Python 2's decompressors don't say, but once their stream has
+    # ended they take no more data: zlib puts it in unused_data and bz2
+    # raises EOFError
+    try:
+        decompressor.decompress(b'\0')
+    except EOFError:
+        return True
+    except (zlib.error, EnvironmentError):
+        return False
+    return decompressor.unused_data[-1:] == b'\0'
+
+# Yields the decompressed contents of the file object f in blocks, where
+# header is what has already been read from the start of f.  Several
+# compressed streams one after another (as written by pigz, pbzip2,
+# 'cat a.gz b.gz', ...) are all decompressed.  Raises IOError if f ends
+# in the middle of a stream, as a truncated file does.
+def DecompressBlocks(f, header, kind):
+    decompressor = NewDecompressor(kind)
+    data = header
+    while True:
+        if data:
+            try:
+                block = decompressor.decompress(data)
+                unused = decompressor.unused_data
+            except EOFError:
+                # bz2 only says that its stream ended when it is given
+                # more data
+                block = b''
+                unused = data
+            if block:
+                yield block
+
+            if unused:
+                # (A stream can end just before the end of a block, so
+                # read on until there is enough to hold any magic)
+                while len(unused) < MAGIC_LENGTH:
+                    more = f.read(BLOCK_SIZE)
+                    if not more:
+                        break
+                    unused += more
+                # Stop at anything that doesn't start a new stream,
+                # such as the zero padding some tools add
+                if Compression(unused) != kind:
+                    return
+                decompressor = NewDecompressor(kind)
+                data = unused
+                continue
+
+        data = f.read(BLOCK_SIZE)
+        if not data:
+            if not StreamEnded(decompressor):
+                raise IOError("compressed input ends in the middle of a %s stream"
+                              % kind)
+            return
+
+# Runs the generator blocks on a separate thread and yields what it
+# yields, keeping up to depth blocks ready ahead of the reader
+def ThreadedBlocks(blocks, depth=8):
+    ready = queue.Queue(depth)
+    stop = threading.Event()
+    # The end of the blocks, or an exception raised while making them,
+    # is passed along as a (None, exception) pair
+    def Produce():
+        try:
+            for block in blocks:
+                if stop.is_set():
+                    return
+                ready.put((block, None))
+            ready.put((None, None))
+        except Exception:
+            ready.put((None, sys.exc_info()[1]))
+
+    thread = threading.Thread(target=Produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            block, error = ready.get()
+            if block is None:
+                if error is not None:
+                    raise error
+                return
+            yield block
+    finally:
+        # If the reader stopped early, let the thread finish
+        stop.set()
+        while thread.is_alive():
+            try:
+                ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+# Yields the contents of the file f (a path or a file object) in blocks
+# of about BLOCK_SIZE bytes, decompressing it if needed
+def ReadBlocks(f):
+    if not IsFile(f):
+        f = open(f, 'rb')
+    header = f.read(MAGIC_LENGTH)
+
+    kind = Compression(header)
+    if kind is None:
+        # (The first block is a whole one, so that callers can check
+        # the start of the file in it)
+        block = header + f.read(BLOCK_SIZE)
+        while block:
+            yield block
+            block = f.read(BLOCK_SIZE)
+    else:
+        for block in ThreadedBlocks(DecompressBlocks(f, header, kind)):
+            yield block
+
+# A record (see MappedRecords()) is ended by a blank line, which is a
+# line with nothing but spaces, tabs and '\r's in it (including none),
+# so a record ends at the first match of RECORD_END_RE after its first
+# line.  BLANK_LINES_RE matches the blank lines between records.
+RECORD_END_RE = re.compile(br'\n[ \t\r]*\n')
+BLANK_LINES_RE = re.compile(br'(?:[ \t\r]*\n)*')
+
+def IsBlankLine(line):
+    return not line.strip(b' \t\r\n')
+
+# The newline before a line that starts with whitespace, and so might
+# be blank
+SPACE_LINE_RE = re.compile(br'\n[ \t\r]')
+
+# Yields a (start, recordEnd, after) triple for each record of buf (a
+# string or a memory-mapped file) from offset pos to offset end: the
+# record's lines run from start to recordEnd (where the newline of its
+# last line is), and the blank line that ends it runs up to after.
+# Blank lines before a record are skipped, and a record that is not
+# ended by offset end is left out.
+# Nearly every record ends with an empty line ('\n\n'), so that is
+# looked for with find(), and RECORD_END_RE is only used for records
+# that have a line starting with whitespace in them.
+def RecordSpans(buf, pos, end):
+    find = buf.find
+    skip = BLANK_LINES_RE.match
+    searchEnd = RECORD_END_RE.search
+    searchSpace = SPACE_LINE_RE.search
+    # The offset of the next line that starts with whitespace
+    nextSpace = -1
+
+    while pos < end:
+        if buf[pos:pos+1] in b'\n \t\r':
+            pos = skip(buf, pos, end).end()
+            if pos >= end:
+                return
+        if nextSpace < pos:
+            match = searchSpace(buf, pos, end)
+            nextSpace = end
+            if match is not None:
+                nextSpace = match.start()
+
+        recordEnd = find(b'\n\n', pos, end)
+        if recordEnd >= 0 and recordEnd < nextSpace:
+            after = recordEnd + 2
+        else:
+            match = searchEnd(buf, pos, end)
+            if match is None:
+                return
+            recordEnd, after = match.span()
+        yield (pos, recordEnd, after)
+        pos = after
+
+# Yields the lines of a sequence of blocks, including their newlines
+def BlockLines(blocks):
+    rest = b''
+    for block in blocks:
+        lines = (rest + block).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if rest:
+        yield rest
+
+# Yields the records of a sequence of blocks the way that
+# MappedRecords() does
+def BlockRecords(blocks, keep=None):
+    rest = b''
+    for block in blocks:
+        buf = rest + block
+        find = buf.find
+
+        pos = 0
+        for (start, recordEnd, pos) in RecordSpans(buf, 0, len(buf)):
+            if keep is None or keep(buf[start:find(b'\n', start, recordEnd + 1)]):
+                yield buf[start:recordEnd].split(b'\n')
+
+        rest = buf[pos:]
+
+# Yields the lines of the file f (a path or a file object) that start
+# at or after byte offset start and before byte offset end, including
+# their newlines
+def MappedLines(f, start=0, end=None):
+    mm = MapFile(f)
+    if mm is None:
+        # Files that can't be mapped can't be seeked in either, so
+        # start and end are ignored for them
+        for line in BlockLines(ReadBlocks(f)):
+            yield line
+        return
+
+    if end is None or end > len(mm):
+        end = len(mm)
+
+    mm.seek(start)
+    readline = mm.readline
+    if end == len(mm):
+        for line in iter(readline, b''):
+            yield line
+    else:
+        pos = start
+        while pos < end:
+            line = readline()
+            pos += len(line)
+            yield line
+
+    mm.close()
+
+# Yields the records of a sequence of blocks like BlockRecords(), but
+# so that nothing is lost: each record that is ended by an empty line
+# is yielded as a (list of lines, None) pair, and everything else
+# (extra blank lines, a record that is ended by a blank line that is
+# not empty, text at the end that is not ended by a blank line) as a
+# (None, text) pair.  Joining the lines of each record with '\n' and
+# adding '\n\n', and adding the other text as is, gives back the
+# original bytes.  A record that grows past maxRecord bytes without
+# being ended is passed on as text.
+def ExactRecords(blocks, maxRecord=4 * BLOCK_SIZE):
+    rest = b''
+    for block in blocks:
+        buf = rest + block
+
+        pos = 0
+        for (start, recordEnd, after) in RecordSpans(buf, 0, len(buf)):
+            if start > pos:
+                # Extra blank lines
+                yield (None, buf[pos:start])
+            if after - recordEnd == 2:
+                yield (buf[start:recordEnd].split(b'\n'), None)
+            else:
+                yield (None, buf[start:after])
+            pos = after
+
+        rest = buf[pos:]
+        if len(rest) > maxRecord:
+            # Keep the last line, which may be the start of the blank
+            # line that ends the record
+            cut = rest.rfind(b'\n', 1)
+            if cut < 0:
+                cut = len(rest)
+            yield (None, rest[:cut])
+            rest = rest[cut:]
+
+    if rest:
+        yield (None, rest)
+
+# Yields each record of the file f between byte offsets start
+# and end as a list of its lines (without newlines).  A record is a
+# run of non-blank lines that is ended by a blank line (see
+# RECORD_END_RE), as in .dtrace files.  Extra blank lines between
+# records are skipped, and any text at the end that is not followed by
+# a blank line is an incomplete record and is not yielded.
+
+# If keep is given, it is called with the first line of each record,
+# and records for which it returns False are skipped over without
+# being sliced out or split into lines.
+
+# Each record costs one slice and one split of the mapping rather than
+# a trip through Python for every line.
+def MappedRecords(f, start=0, end=None, keep=None):
+    mm = MapFile(f)
+    if mm is None:
+        blocks = ReadBlocks(f)
+        first = next(blocks, b'')
+        blocks = itertools.chain([first], blocks)
+        # (See below about '\r')
+        if b'\r' in first[:65536]:
+            records = GroupRecords(BlockLines(blocks), keep)
+        else:
+            records = BlockRecords(blocks, keep)
+        for record in records:
+            yield record
+        return
+
+    if end is None or end > len(mm):
+        end = len(mm)
+
+    # Files with '\r\n' line endings (or any other stray '\r') are
+    # grouped one line at a time, so that the '\r's come off the lines
+    if mm.find(b'\r', start, min(end, start + 65536)) >= 0:
+        for record in GroupRecords(MappedLines(f, start, end), keep):
+            yield record
+        mm.close()
+        return
+
+    find = mm.find
+    for (start, recordEnd, after) in RecordSpans(mm, start, end):
+        if keep is None or keep(mm[start:find(b'\n', start, recordEnd + 1)]):
+            yield mm[start:recordEnd].split(b'\n')
+
+    mm.close()
+
+# Splits the file at path into at most numChunks byte ranges that each
+# begin at the start of a record (as read by MappedRecords()), so that
+# every record falls entirely within one range.  Returns a list of
+# (start, end) pairs in file order.
+def SplitRecords(path, numChunks):
+    size = os.path.getsize(path)
+    bounds = [0]
+
+    f = open(path, 'rb')
+    for i in range(1, numChunks):
+        pos = size * i // numChunks
+        if pos <= bounds[-1]:
+            continue
+
+        # Skip the rest of the line we landed in, then move forward past
+        # the next blank line, which ends the record we are in (or is
+        # between records)
+        f.seek(pos)
+        f.readline()
+        line = f.readline()
+        while line and not (line[-1:] == b'\n' and IsBlankLine(line)):
+            line = f.readline()
+
+        if not line:
+            break
+        start = f.tell()
+        if start > bounds[-1] and start < size:
+            bounds.append(start)
+    f.close()
+
+    bounds.append(size)
+    return [(bounds[i], bounds[i+1]) for i in range(len(bounds) - 1)]
+
+# Groups a sequence of lines into records the way that MappedRecords()
+# does, taking the '\r\n' or '\n' off the end of each line
+def GroupRecords(lines, keep=None):
+    record = []
+    skipping = False
+    for line in lines:
+        line = line.rstrip(b'\r\n')
+        if not IsBlankLine(line):
+            if skipping:
+                continue
+            elif not record and keep is not None and not keep(line):
+                # Drop the rest of this record as it goes by
+                skipping = True
+            else:
+                record.append(line)
+        else:
+            skipping = False
+            if record:
+                yield record
+                record = []
+
+
+# Collects the many small strings that the scripts write (a line or a
+# record at a time) and hands them on to the file object out in chunks
+# of about bufferSize bytes, so that writing costs one call per chunk
+# no matter how out itself is buffered (e.g. stdout on a pipe).
+class ChunkedWriter(object):
+    def __init__(self, out, bufferSize=1 << 20, closeOut=False):
+        self.out = out
+        self.bufferSize = bufferSize
+        self.closeOut = closeOut
+        self.chunks = []
+        self.size = 0
+
+    def write(self, s):
+        self.chunks.append(s)
+        self.size += len(s)
+        if self.size >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.out.write(''.join(self.chunks))
+            # Reuse the same list for the next chunk
+            del self.chunks[:]
+            self.size = 0
+        # (Python 2's BZ2File can't be flushed)
+        if hasattr(self.out, 'flush'):
+            self.out.flush()
+
+    def close(self):
+        self.flush()
+        if self.closeOut:
+            self.out.close()
+
+# Opens the file at path for writing, compressing everything written
+# to it if its name ends in .gz, .bz2 or .xz
+def CreateFile(path):
+    if path.endswith('.gz'):
+        # Level 6 (gzip's own default) is much faster than the level 9
+        # that the gzip module uses by default, for slightly bigger files
+        return gzip.GzipFile(path, 'wb', 6)
+    elif path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'wb')
+    elif path.endswith('.xz'):
+        if lzma is None:
+            raise IOError("writing xz files needs the lzma module")
+        return lzma.LZMAFile(path, 'wb')
+    else:
+        return open(path, 'wb')
+
+# Returns a ChunkedWriter for the --output option of a script: the
+# file at path (see CreateFile()), or stdout if path is None or '-'
+def OpenOutput(path=None, bufferSize=1 << 20):
+    if path is None or path == '-':
+        return ChunkedWriter(sys.stdout, bufferSize)
+    else:
+        return ChunkedWriter(CreateFile(path), bufferSize, closeOut=True)
+
+# Loads the script scripts/<name>.py (e.g. 'decls2comp') as a module,
+# so that a driver can call its main() or library routines without
+# starting a new interpreter for every file.  Hyphens in the name
+# become underscores in the module name.
+def LoadScript(name):
+    modName = name.replace('-', '_')
+    if modName not in sys.modules:
+        import imp
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            name + '.py')
+        imp.load_source(modName, path)
+    return sys.modules[modName]
@@ -0,0 +1,93 @@
+# Memoized versions of the Dfec/Kvasir name conversions in
+# daikon_format.py.  A conversion script calls them on the same few
+# hundred variable names (and a few thousand program point names) over
+# and over, once per declaration or per record, so each converted name
+# is computed once and looked up after that.
+
+# Each cache is a dict from the original name to the converted one, so
+# a hit costs one dict lookup.  The converted names are interned, so
+# the maps that the scripts build out of them share their keys.
+
+# The caches are bounded, and keep the names that were used recently:
+# new names go into a young generation, and when that fills up (at half
+# the limit) it becomes the old generation and the previous old one is
+# dropped.  A name found in the old generation moves back into the
+# young one.  (This is cheaper than keeping the exact order of use, as
+# collections.OrderedDict would, and for these workloads, where the
+# distinct names fit many times over, it makes no difference.)
+
+# Each cache counts its lookups and misses; CountNameCaches() adds them
+# to a daikon_stats.Stats, which reports the hit rate of each cache.
+
+# From Python, call DfecVarNames.Convert(name) in place of
+# daikon_format.ConvertDfecVarName(name), DfecVarNames.ConvertAll(names)
+# for a whole list, and so on.
+
+from daikon_format import (ConvertDfecVarName, ConvertKvasirVarName,
+                           StripDfecPptName)
+
+# Default limit on the number of names in each cache
+MAX_NAMES = 1 << 16
+
+def InternName(name):
+    if isinstance(name, tuple):
+        return tuple([intern(part) for part in name])
+    else:
+        return intern(name)
+
+class NameCache(dict):
+    # name is what the counts are called in the stats, and convert is
+    # the function to memoize
+    def __init__(self, name, convert, maxNames=MAX_NAMES):
+        dict.__init__(self)
+        self.name = name
+        self.convert = convert
+        self.maxYoung = max(maxNames // 2, 1)
+        self.old = {}
+        self.lookups = 0
+        self.misses = 0
+
+    # Called by dict lookups that miss the young generation
+    def __missing__(self, name):
+        converted = self.old.get(name)
+        if converted is None:
+            self.misses += 1
+            converted = InternName(self.convert(name))
+        if len(self) >= self.maxYoung:
+            self.old = dict(self)
+            self.clear()
+        self[name] = converted
+        return converted
+
+    def Convert(self, name):
+        self.lookups += 1
+        return self[name]
+
+    # Returns a list of the converted names
+    def ConvertAll(self, names):
+        self.lookups += len(names)
+        return map(self.__getitem__, names)
+
+DfecVarNames = NameCache('dfec_var_names', ConvertDfecVarName)
+KvasirVarNames = NameCache('kvasir_var_names', ConvertKvasirVarName)
+
+# This keeps the exit number, like passing keepExitId=True to
+# StripDfecPptName()
+DfecPptNames = NameCache('dfec_ppt_names',
+                         lambda ppt: StripDfecPptName(ppt, keepExitId=True))
+
+NAME_CACHES = [DfecVarNames, KvasirVarNames, DfecPptNames]
+
+# Adds the lookups and misses of each cache that was used to stats (as
+# the counters <cache>_hits and <cache>_misses) and starts counting
+# again from zero, so that each lookup is only counted once even when
+# the counts of several worker processes are merged.  If stats is None
+# the counts are just dropped; use this as the initializer of a worker
+# pool so that the workers don't count the lookups they inherited.
+def CountNameCaches(stats=None):
+    for cache in NAME_CACHES:
+        if stats is not None and cache.lookups:
+            stats.Count(cache.name + '_hits', cache.lookups - cache.misses)
+            stats.Count(cache.name + '_misses', cache.misses)
+        cache.lookups = 0
+        cache.misses = 0
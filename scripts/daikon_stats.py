@@ -0,0 +1,191 @@
+# Instrumentation for the conversion scripts in this directory: the
+# wall and CPU time of each phase of a run, counters (such as matched
+# and unmatched program points), and the throughput of the main loop.
+# Everything is written as JSON, one object per line, so that the
+# output of long runs can be followed with tail -f and parsed later.
+
+# Lines look like:
+#  {"event": "progress", "elapsed": 10.0, "records": 51200,
+#   "records_per_sec": 5120.0, "bytes": 9000000, "bytes_per_sec": 900000.0}
+#  {"event": "summary", "wall": 12.5, "cpu": 12.1,
+#   "phases": {"decls parse": {"wall": 1.2, "cpu": 1.1}, ...},
+#   "counts": {...}, "hit_rates": {...}, "records": ...,
+#   "records_per_sec": ..., ...}
+# A progress line is written at most once per interval, and the summary
+# line once at the end.  Phases that are timed inside a loop (rather
+# than around it) get the CPU time of the process that ran them, from
+# time.clock(), and a worker process passes its own back in its
+# Snapshot().  Counters that come in pairs
+# named X_hits and X_misses (such as those of the caches in
+# daikon_names.py) also get the hit rate X in "hit_rates".
+
+# The CPU times include worker processes once they have exited, so
+# they cover the pool of a --jobs run as long as the pool is closed
+# before the phase ends.
+
+# From Python, create a Stats (or call OpenStats()) and pass it to the
+# routines of the scripts that take a stats argument.
+
+import sys
+import os
+import time
+import json
+from contextlib import contextmanager
+
+def CpuTime():
+    t = os.times()
+    # User and system time of this process and its finished children
+    return t[0] + t[1] + t[2] + t[3]
+
+class Stats(object):
+    # out is the file object that the JSON lines go to, or None to only
+    # collect the numbers (e.g. in a worker process, see Snapshot()).
+    # interval is the minimum number of seconds between progress lines,
+    # or None for no progress lines.
+    def __init__(self, out=None, interval=None):
+        self.out = out
+        self.interval = interval
+
+        self.startWall = time.time()
+        self.startCpu = CpuTime()
+
+        # Key: phase name, Value: [wall time, CPU time or None]
+        self.phases = {}
+        # Key: counter name, Value: count
+        self.counts = {}
+        # Key: counter name, Value: set of distinct names counted, so
+        # that names seen by several workers are only counted once
+        self.names = {}
+
+        # Throughput of the main loop
+        self.records = 0
+        self.bytes = 0
+        self.lastReport = (self.startWall, 0, 0)
+
+    def Count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def AddNames(self, name, names):
+        self.names.setdefault(name, set()).update(names)
+
+    def AddTime(self, name, wall, cpu=None):
+        entry = self.phases.setdefault(name, [0.0, None])
+        entry[0] += wall
+        if cpu is not None:
+            entry[1] = (entry[1] or 0.0) + cpu
+
+    # Times the body of a with statement as the phase name
+    @contextmanager
+    def Phase(self, name):
+        startWall = time.time()
+        startCpu = CpuTime()
+        try:
+            yield
+        finally:
+            self.AddTime(name, time.time() - startWall, CpuTime() - startCpu)
+
+    # Adds records and bytes to the running totals, and writes a
+    # progress line if the interval has passed
+    def Progress(self, numRecords, numBytes):
+        self.records += numRecords
+        self.bytes += numBytes
+        if self.interval is None or self.out is None:
+            return
+
+        now = time.time()
+        lastTime, lastRecords, lastBytes = self.lastReport
+        if now - lastTime < self.interval:
+            return
+        elapsed = now - lastTime
+        self.Emit({'event': 'progress',
+                   'elapsed': now - self.startWall,
+                   'records': self.records,
+                   'records_per_sec': (self.records - lastRecords) / elapsed,
+                   'bytes': self.bytes,
+                   'bytes_per_sec': (self.bytes - lastBytes) / elapsed})
+        self.lastReport = (now, self.records, self.bytes)
+
+    # Returns the numbers collected so far in a form that can be sent
+    # back from a worker process and added in with Merge()
+    def Snapshot(self):
+        return (dict([(name, tuple(entry)) for (name, entry) in self.phases.items()]),
+                self.counts, self.names, self.records, self.bytes)
+
+    def Merge(self, snapshot):
+        times, counts, names, numRecords, numBytes = snapshot
+        for (name, (wall, cpu)) in times.items():
+            self.AddTime(name, wall, cpu)
+        for (name, n) in counts.items():
+            self.Count(name, n)
+        for (name, distinct) in names.items():
+            self.AddNames(name, distinct)
+        self.Progress(numRecords, numBytes)
+
+    def Emit(self, obj):
+        if self.out is not None:
+            self.out.write(json.dumps(obj, sort_keys=True) + '\n')
+            self.out.flush()
+
+    # Writes the summary line
+    def Report(self):
+        wall = time.time() - self.startWall
+        phases = {}
+        for (name, (phaseWall, phaseCpu)) in self.phases.items():
+            phases[name] = {'wall': phaseWall}
+            if phaseCpu is not None:
+                phases[name]['cpu'] = phaseCpu
+
+        counts = dict(self.counts)
+        for (name, distinct) in self.names.items():
+            counts[name] = len(distinct)
+
+        hitRates = {}
+        for (name, hits) in counts.items():
+            if name.endswith('_hits') and name[:-5] + '_misses' in counts:
+                lookups = hits + counts[name[:-5] + '_misses']
+                if lookups:
+                    hitRates[name[:-5]] = float(hits) / lookups
+
+        summary = {'event': 'summary',
+                   'wall': wall,
+                   'cpu': CpuTime() - self.startCpu,
+                   'phases': phases,
+                   'counts': counts}
+        if hitRates:
+            summary['hit_rates'] = hitRates
+        if self.records or self.bytes:
+            summary['records'] = self.records
+            summary['bytes'] = self.bytes
+            if wall > 0:
+                summary['records_per_sec'] = self.records / wall
+                summary['bytes_per_sec'] = self.bytes / wall
+        self.Emit(summary)
+
+# Times the body of a with statement as the phase name of stats, or
+# does nothing if stats is None
+@contextmanager
+def TimePhase(stats, name):
+    if stats is None:
+        yield
+    else:
+        with stats.Phase(name):
+            yield
+
+# Returns a Stats that writes to the file at path ('-' for stderr), or
+# None if path is None
+def OpenStats(path, interval=None):
+    if path is None:
+        return None
+    elif path == '-':
+        return Stats(sys.stderr, interval)
+    else:
+        return Stats(open(path, 'w'), interval)
+
+# Writes the summary line and closes the file of a Stats from
+# OpenStats() (if it isn't None)
+def CloseStats(stats):
+    if stats is None:
+        return
+    stats.Report()
+    if stats.out is not sys.stderr:
+        stats.out.close()
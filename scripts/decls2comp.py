@@ -7,17 +7,31 @@
 # Created on 2005-05-13 by Philip J. Guo
 # MIT CSAIL Program Analysis Group
 
-# Input: .decls file with comparability numbers
+# Input: .decls file with comparability numbers, in either the
+# decls 2.0 format or the old DECLARE format
 
 # Output: A file which lists the comparability sets of all relevant
 # variables at each program point, alphabetically sorted and separated
 # by spaces.  All program points are also sorted by alphabetical
 # order. Output is written to stdout by default
 
-# Usage: ./decls2comp.py input.decls 'no-hashcodes' [optional]
+# Usage: ./decls2comp.py [--jobs N] [--cache FILE] [--dedup] [--output FILE] input.decls 'no-hashcodes' [optional]
 # Running this with the 'no-hashcodes' string as the 2nd arg results
 # in the tool ignoring all variables of rep. type 'hashcode' or
 # 'hashcode[]', etc...
+# --jobs N parses and groups program points in N worker processes.
+# The output is identical to a serial run.
+# --cache FILE keeps the comparability sets of every program point in
+# FILE, keyed by a hash of its declaration, and reuses them on the next
+# run for program points whose declarations have not changed.
+# --dedup collapses identical declarations of the same program point
+# into one entry, whose name is followed by ' (xN)' where N is the
+# number of declarations collapsed into it (if more than 1).
+# --output FILE writes the output to FILE instead of stdout.
+# The input may be compressed with gzip, bzip2 or xz, and the output is
+# compressed if FILE ends in .gz, .bz2 or .xz.
+# From Python, load this with daikon_io.LoadScript('decls2comp') and
+# call Decls2Comp(), CompEntries() or main(argv).
 
 # Prog pt name
 # All variable names in one comp set
@@ -88,14 +102,18 @@
 #             for the --dyncomp-print-inc option
 
 # 2009-06-07: Rewrote to handle decls 2.0 format.
-# TODO: Reenable no-hashcode and lackwit(maybe?) support.
 
-VAR_START = "variable "
-PPT_START = "ppt "
-REP_START = "rep-type "
-COMP_START = "comparability "
+# 2026-10-18: Handles both the old DECLARE format and decls 2.0 again
+#             (detected from the header), so decls2comp-1.0.py is gone.
+#             Reenabled 'no-hashcodes' and Lackwit array comparability
+#             numbers (for the old format).
 
 import sys
+import os
+import hashlib
+import marshal
+from daikon_io import MappedLines, OpenOutput, IsSplittable
+from daikon_format import DECLS_V1, IsPptLine, DetectVersion, ReadPptBlocks, ParseVars
 
 # Note: Lackwit produces comparability numbers for arrays in the
 # following format: '9[10]' - we are going to ignore what is between
@@ -105,122 +123,317 @@ LWArrayRExp = re.compile('\[.\]')
 
 ignoreHashcodes = False
 
-if (len(sys.argv) < 2):
-    print "Usage: decls2compy decls-file [no-hashcodes]"
-    sys.exit()
-
-
-if ((len(sys.argv) == 3) and
-    sys.argv[2] == "no-hashcodes"):
-    ignoreHashcodes = True
-
 # If 'no-hashcodes' option is on, then ignore all variables whose
 # rep. type is hashcode
 hashcodeRE = re.compile('hashcode.*')
 
 
-f = open(sys.argv[1], 'r')
-
-# Break each program point declaration up into separate lists.
-# Program points are separated by "DECLARE" statements
-# Key: program point name
-# Value: list of all strings following program point
-allPpts = {}
-
-tempAllPpts = [] # Temporary before placing in allPpts
-
-for line in f.readlines():
-    line = line.strip()
-
-    if line[0:4] == "ppt ":
-        tempAllPpts.append([line[len(PPT_START):]]) # Start a new list
-        isIntermediate = 0
-    elif line != "" and line[0] != "#": # Don't add blank lines & comments
-        if len(tempAllPpts) > 0:
-            tempAllPpts[-1].append(line) # Append line to the latest entry
-
-
-# Init allPpts from tempAllPpts
-for pptList in tempAllPpts:
-    # Allow duplicates by appending numeric indices onto program point
-    # name
-    index = 1
-
-    pptName = pptList[0]
+def IsIgnoredRepType(repType):
+    return ignoreHashcodes and repType is not None and hashcodeRE.match(repType)
 
-    # There is already an entry
-    if pptList[0] in allPpts:
-        # Try appending numbers until there isn't an entry
-        found = 1
-        while found:
-            pptName = pptList[0] + ' (' + str(index) + ')'
-            if not (pptName in allPpts):
-                break
-            index += 1
+# Turns the block of a program point into a map where the keys are
+# variable names and the values are comparability numbers.  Variables
+# with an ignored rep. type are dropped here, before they ever get
+# stored.
+def ParseVarComps(block, version):
+    var2comp = {}
 
-    allPpts[pptName] = pptList[1:]
+    for var in ParseVars(block, version):
+        curComp = var.comp
+        if curComp is None or IsIgnoredRepType(var.repType):
+            continue
 
-# Alphabetically sort the program points
-sortedPptKeys = allPpts.keys()
-sortedPptKeys.sort()
+        if version == DECLS_V1:
+            isArrayMatch = LWArrayRExp.search(curComp)
+            if isArrayMatch:
+                curComp = curComp[:isArrayMatch.start()]
 
-# Process each PPT
-for pptName in sortedPptKeys:
-    v = allPpts[pptName]
-    i = 0
-    var2comp = {} # Key: variable name, Value: comparability number
+        var2comp[var.name] = curComp
 
+    return var2comp
 
-    # The comparability info for a variable at a program point is
-    # prefixed by comparability
+# Yields a (program point name, var2comp) pair for each program point
+# in f, parsing as the file is read
+def ReadPpts(f):
+    version, lines = DetectVersion(f)
+    for (pptName, block) in ReadPptBlocks(lines, version):
+        yield (pptName, ParseVarComps(block, version))
 
-    curVar = None
-    for line in v:
-        strippedLine = line.strip()
 
-        if strippedLine[0:len(VAR_START)] == VAR_START:
-            curVar = strippedLine[len(VAR_START):]
-        elif strippedLine[0:len(REP_START)] == REP_START:
-            assert(curVar) #There should have been a variable entry before rep-type
-            curRep = strippedLine[len(REP_START):]
-        elif strippedLine[0:len(COMP_START)] == COMP_START:
-            assert(curVar) #There should have been a variable entry before comparability
-            curComp = strippedLine[len(COMP_START):]
-            var2comp[curVar] = curComp
-
-
-    # Now we can do the real work of grouping variables together
-    # in comparability sets based on their numbers
+# Groups the variables of a program point into comparability sets
+# based on their numbers.  Returns a list of sets, each of which is an
+# alphabetically sorted list of variable names, and the sets are
+# ordered by their first variable.  Variables are sorted once and
+# dropped into a hash keyed by comparability number, so this is
+# O(V log V) rather than re-sorting after every set.
+def GroupVars(var2comp):
     sortedVars = var2comp.keys()
     sortedVars.sort()
 
-    print pptName
-
-    while len(sortedVars) > 0:
-        varName = sortedVars[0]
-
-#        if var2comp[varName] == '-1': # Remember that everything is a string
-#            print '-1:', varName,
-#        else:
-        print varName,
+    # Key: comparability number, Value: the set holding those variables
+    comp2set = {}
+    compSets = []
 
+    for varName in sortedVars:
         compNum = var2comp[varName]
-
-        if compNum:
-            del var2comp[varName]
-
-            sortedVars = var2comp.keys()
-            sortedVars.sort()
-
-            for otherVar in sortedVars:
-                if var2comp[otherVar] == compNum:
-                    print otherVar,
-                    del var2comp[otherVar]
-        print
-
-        # Update sortedVars after deleting the appropriate entries
-        # from var2comp
-        sortedVars = var2comp.keys()
-        sortedVars.sort()
-
-    print
+        if compNum in comp2set:
+            comp2set[compNum].append(varName)
+        else:
+            compSet = [varName]
+            comp2set[compNum] = compSet
+            compSets.append(compSet)
+
+    return compSets
+
+
+# Returns the comparability sets of a program point as the text that
+# goes between its name and the blank line: one line per set, with
+# the variable names separated by spaces
+def FormatSets(var2comp):
+    return ''.join([' '.join(compSet) + '\n'
+                    for compSet in GroupVars(var2comp)])
+
+
+# Splits the .decls file at path into at most numChunks byte ranges,
+# each of which (except the first) begins at a 'ppt' (or 'DECLARE')
+# line, so that every program point falls entirely within one range.
+# Returns a list of (path, version, start, end) tuples in file order.
+def SplitPpts(path, version, numChunks):
+    size = os.path.getsize(path)
+    bounds = [0]
+
+    f = open(path, 'r')
+    for i in range(1, numChunks):
+        pos = size * i // numChunks
+        if pos <= bounds[-1]:
+            continue
+
+        # Skip the rest of the line we landed in, then move forward to
+        # the start of the next program point
+        f.seek(pos)
+        f.readline()
+        start = f.tell()
+        line = f.readline()
+        while line and not IsPptLine(line.strip(), version):
+            start = f.tell()
+            line = f.readline()
+
+        if not line:
+            break
+        if start > bounds[-1]:
+            bounds.append(start)
+    f.close()
+
+    bounds.append(size)
+    return [(path, version, bounds[i], bounds[i+1])
+            for i in range(len(bounds) - 1)]
+
+# The --cache file maps the digest of each program point's declaration
+# block to its formatted comparability sets, so that program points
+# which did not change since the last run do not have to be parsed or
+# grouped again.  The options that affect the output are mixed into
+# every digest so that runs with different options never share entries.
+CACHE_VERSION = "decls2comp-cache-1"
+
+# Key: block digest, Value: formatted comparability sets
+# (None when --cache is not in use)
+compCache = None
+cacheSalt = CACHE_VERSION
+
+def BlockDigest(pptName, version, block):
+    return hashlib.md5('\n'.join([cacheSalt, str(version), pptName] + block)).digest()
+
+# Returns the contents of the cache file at path, or an empty cache if
+# the file is missing or unreadable (e.g. written by another version
+# of Python)
+def LoadCache(path):
+    try:
+        f = open(path, 'rb')
+        try:
+            cache = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+def SaveCache(path, cache):
+    tmpPath = path + '.tmp'
+    f = open(tmpPath, 'wb')
+    marshal.dump(cache, f)
+    f.close()
+    os.rename(tmpPath, path)
+
+# Parses and groups the program points of a sequence of lines, pulling
+# unchanged ones out of compCache if it is in use.  Returns a list of
+# (program point name, digest, formatted sets) triples in file order;
+# digest is None when the cache is not in use.
+def ProcessLines(lines, version):
+    result = []
+    for (pptName, block) in ReadPptBlocks(lines, version):
+        if compCache is None:
+            result.append((pptName, None,
+                           FormatSets(ParseVarComps(block, version))))
+        else:
+            digest = BlockDigest(pptName, version, block)
+            compSets = compCache.get(digest)
+            if compSets is None:
+                compSets = FormatSets(ParseVarComps(block, version))
+                # Repeated declarations only get grouped once
+                compCache[digest] = compSets
+            result.append((pptName, digest, compSets))
+    return result
+
+# Worker for --jobs: parses and groups the program points in one byte
+# range of a .decls file
+def ProcessChunk(chunk):
+    path, version, start, end = chunk
+    return ProcessLines(MappedLines(path, start, end), version)
+
+
+# Collects the program points of each chunk result into a map from
+# program point name to formatted sets, renaming (or with dedup,
+# collapsing) duplicates.  Returns (that map, a map from each name to
+# the number of declarations collapsed into it, the cache entries of
+# the program points that were seen).
+def MergePpts(allChunks, dedup):
+    # Key: program point name
+    # Value: formatted comparability sets for that program point
+    allPpts = {}
+
+    # Key: program point name
+    # Value: the next index to try when it shows up again
+    nextIndex = {}
+
+    # For dedup only:
+    # Key: (program point name, digest), Value: its key in allPpts
+    seenDecls = {}
+    # Key: key in allPpts, Value: # of identical declarations collapsed into it
+    declCounts = {}
+
+    # The cache to write back out.  Only digests seen in this run are put
+    # in it, which evicts the entries of program points that are gone.
+    newCache = {}
+
+    for chunkResult in allChunks:
+        for (name, digest, compSets) in chunkResult:
+            if dedup:
+                if (name, digest) in seenDecls:
+                    declCounts[seenDecls[(name, digest)]] += 1
+                    continue
+
+            # Allow duplicates by appending numeric indices onto program point
+            # name
+            pptName = name
+
+            # There is already an entry
+            if name in allPpts:
+                # Pick up numbering where the last duplicate left off, and
+                # keep going only if that name happens to be taken too
+                index = nextIndex.get(name, 1)
+                pptName = name + ' (' + str(index) + ')'
+                while pptName in allPpts:
+                    index += 1
+                    pptName = name + ' (' + str(index) + ')'
+                nextIndex[name] = index + 1
+
+            allPpts[pptName] = compSets
+            if dedup:
+                seenDecls[(name, digest)] = pptName
+                declCounts[pptName] = 1
+            if digest is not None:
+                newCache[digest] = compSets
+
+    return (allPpts, declCounts, newCache)
+
+# Yields the output for the .decls file f (a path or a file object)
+# one program point at a time, sorted by program point name: its name
+# line and comparability set lines, followed by a blank line.  All of
+# the program points have to be read before the first one can be
+# yielded (to sort them), but the output is never put together as one
+# string.  The keyword arguments match the command-line options;
+# jobs > 1 needs a file that can be reopened by name.
+def CompEntries(f, noHashcodes=False, jobs=1, cache=None, dedup=False):
+    global ignoreHashcodes, compCache, cacheSalt
+
+    ignoreHashcodes = noHashcodes
+    cacheSalt = CACHE_VERSION
+    compCache = None
+    if cache:
+        # Load this before starting any workers so that they inherit it
+        compCache = LoadCache(cache)
+        cacheSalt = '%s %s' % (CACHE_VERSION, ignoreHashcodes)
+    elif dedup:
+        # dedup needs the digests, so use an in-memory cache
+        compCache = {}
+
+    # Each element is a list of (program point name, digest, formatted
+    # sets) triples, and the elements are in file order
+    version, lines = DetectVersion(MappedLines(f))
+
+    # Compressed files can't be split up, so they are always read
+    # serially
+    pool = None
+    if jobs > 1 and IsSplittable(getattr(f, 'name', f)):
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        # Use a few more chunks than workers to even out the load
+        chunks = SplitPpts(getattr(f, 'name', f), version, jobs * 4)
+        allChunks = pool.imap(ProcessChunk, chunks)
+    else:
+        allChunks = [ProcessLines(lines, version)]
+
+    try:
+        allPpts, declCounts, newCache = MergePpts(allChunks, dedup)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if cache:
+        SaveCache(cache, newCache)
+
+    # Alphabetically sort the program points
+    sortedPptKeys = allPpts.keys()
+    sortedPptKeys.sort()
+
+    # Process each PPT
+    for pptName in sortedPptKeys:
+        if declCounts.get(pptName, 1) > 1:
+            header = pptName + ' (x' + str(declCounts[pptName]) + ')\n'
+        else:
+            header = pptName + '\n'
+        yield header + allPpts[pptName] + '\n'
+
+# Writes the comparability sets of every program point in the .decls
+# file f to the file object out (see CompEntries())
+def Decls2Comp(f, out, noHashcodes=False, jobs=1, cache=None, dedup=False):
+    for entry in CompEntries(f, noHashcodes, jobs, cache, dedup):
+        out.write(entry)
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(usage="decls2comp.py [--jobs N] [--cache FILE] [--dedup] [--output FILE] decls-file [no-hashcodes]")
+    parser.add_argument('declsFile')
+    parser.add_argument('filter', nargs='?')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes to use")
+    parser.add_argument('--cache', metavar='FILE',
+                        help="reuse comparability sets of unchanged program points from FILE")
+    parser.add_argument('--dedup', action='store_true',
+                        help="collapse identical declarations of a program point into one entry")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="write the output to FILE instead of stdout")
+    args = parser.parse_args(argv[1:])
+
+    out = OpenOutput(args.output)
+    Decls2Comp(args.declsFile, out,
+               noHashcodes=(args.filter == "no-hashcodes"),
+               jobs=args.jobs, cache=args.cache, dedup=args.dedup)
+    out.close()
+
+if __name__ == '__main__':
+    main(sys.argv)
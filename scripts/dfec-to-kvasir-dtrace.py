@@ -1,318 +1,483 @@
 #!/usr/bin/python
 
-# Usage: ./dfec-to-kvasir-dtrace.py <kvasir .decls file> <dfec .dtrace file>
+# Usage: ./dfec-to-kvasir-dtrace.py [--jobs N] [--index] [--exits POLICY] [--output FILE] <kvasir .decls file> <dfec .dtrace file>
+#        ./dfec-to-kvasir-dtrace.py [--jobs N] [--index] [--exits POLICY] --output-dir DIR <kvasir .decls file> <dfec .dtrace file> ...
+# --jobs N splits the .dtrace file into pieces at record boundaries and
+# converts them in N worker processes.  The output is identical to a
+# serial run.
+# --output FILE writes the .dtrace file to FILE instead of stdout.
+# --decls-cache DIR keeps the parsed .decls file in DIR so that later
+# runs with the same .decls file skip parsing it (see daikon_cache.py).
+# It defaults to $DAIKON_DECLS_CACHE.
+# --stats FILE writes timing and throughput numbers, along with the hit
+# rates of the name caches (see daikon_names.py), as JSON lines to
+# FILE ('-' for stderr), with a progress line at most every
+# --stats-interval seconds (see daikon_stats.py).
+# --output-dir DIR converts each of the .dtrace files into a file with
+# the same name in DIR, reading the .decls file only once.  With --jobs
+# N, N files are converted at a time.
+# --index reads only the records of the program points in the .decls
+# file, using the index that dtrace-index.py keeps next to the .dtrace
+# file (which is built or updated first if needed).  Each file is then
+# converted in one piece, so --jobs only applies to --output-dir.
+# --exits POLICY says what to do with the records of Dfec's numbered
+# exits (EXIT1, EXIT2, ...), since Kvasir only declares EXIT0:
+# 'merge' (the default) writes all of them as EXIT0 records, and 'all'
+# keeps their own exit names, to go with a .decls file that
+# dfec-to-kvasir.py wrote with --exits all.  (Its other policies only
+# choose which Dfec declaration supplies the comparability numbers,
+# which makes no difference to the records.)
+# Either input may be compressed with gzip, bzip2 or xz, and the output
+# is compressed if FILE ends in .gz, .bz2 or .xz.
 
 # Outputs a Kvasir-compatible .dtrace file from the Dfec .dtrace file
 # based on the variables and ordering in the Kvasir .decls file
 
 # Cannibalized from dfec-to-kvasir.py so most of these comments
 # will make absolutely no sense!!!
-import sys
-
-# Process command-line args:
-kvasirDeclsF = open(sys.argv[1], 'r')
-kvasirDeclsAllLines = [line.strip() for line in kvasirDeclsF.readlines()]
-kvasirDeclsF.close()
-
-
-
-import re
-DfecGlobalRE = re.compile('^::')
-
-# Dfec and Kvasir variable differences:
-
-# Globals are prefixed with a '::' in Dfec
-# and with a '/' in Kvasir
-
-# Dfec doesn't append the filename in front of
-# file-static global variables like Kvasir does
-
-# Dfec also doesn't print out function-static variables
-# while Kvasir does
-
-# Dfec derives two Daikon variables for strings
-# one for the pointer and the other for the contents,
-# while Kvasir only has one for the contents.
-
-# Dfec uses the arrow notation for struct names while
-# Kvasir uses the bracket notation (unless disambiguation
-# information is provided)
 
-# Converts variable var's name from Dfec conventions
-# to Kvasir conventions and returns it as the result
-def ConvertDfecVarName(var):
-    globalConverted = DfecGlobalRE.sub('/', var)
-    return globalConverted.replace('->', '[].')
-
-# Ok, we are going to just strip off everything before
-# the '/', if there is one, because Dfec does not print
-# out the function name for function-static variables
-# e.g. 'flex_c@epsclosure/did_stk_init' becomes '/did_stk_init'
-def ConvertKvasirVarName(var):
-    if var[0] == '/':
-        return var
-    elif '/' in var:
-        return '/' + var.split('/')[1]
-    else:
-        return var
-
-# Kvasir does not support comparability for array indices
-# so strip those off.
-# e.g. '104[105]' becomes '104'
-def StripCompNumber(comp_num):
-    if '[' in comp_num:
-        return comp_num[:comp_num.find('[')]
-    else:
-        return comp_num
-
-# Dfec and Kvasir program point name differences:
-
-# Global program point names in Dfec are prefixed by 'std.'
-# while they are prefixed by '..' in Kvasir
-
-# Dfec uses 'EXIT1' while Kvasir uses 'EXIT0' for the exit
-# so we should probably simply search for 'EXIT' without
-# regard to the number behind it.  However, Dfec can have
-# more than 1 exit while Kvasir can only have 1.  Hmmm,
-# what do we do about that?
-# (Right now, we just keep 'EXIT' without the number before
-#  putting it in the hashtable.  Thus, only one EXIT ppt
-#  is kept for each function ... I'm just not sure which
-#  one, though, but that's ok)
-
-# Dfec's names for C functions have crap in between the parens
-# while Kvasir's doesn't.  Let's just not worry about what's
-# in the parens since C doesn't have overloading.  We just want
-# to strip off the canonical function name.
-
-# Strips the extraneous stuff off of Dfec's names and returns
-# a 2-tuple of ppt name and either 'ENTER' or 'EXITxxx'
-
-# Input:  'std.ccladd(int;int;)void:::ENTER'
-# Output: ('ccladd', 'ENTER')
-
-def StripDfecPptName(ppt):
-    fnname, enterOrExit = ppt.split(':::')
-    if fnname[:4] == 'std.':
-        fnname = fnname[4:]
-    # Find the first '(' and end the function name there
-    fnname = fnname[:fnname.index('(')]
-
-    # Just return 'ENTER' or 'EXIT' with no numbers
-    # (This means that we can only keep one exit ppt)
-    if enterOrExit[1] == 'N':
-        enterOrExit = 'ENTER'
-    else:
-        enterOrExit = 'EXIT'
-
-    # Return a pair of the function name and 'ENTER' or 'EXITxxx'
-    return (fnname, enterOrExit)
-
-
-def StripKvasirPptName(ppt):
-    fnname, enterOrExit = ppt.split(':::')
-
-    # For globals, grab everything from '..' to '('
-    # e.g. for '..main():::ENTER'
-    # we want 'main'
-    if fnname[:2] == '..':
-        fnname = fnname[2:fnname.find('(')]
-
-    # For file-static names, we need to take everything between
-    # the LAST period ('.') and the '('
-    # e.g. for 'flex.c.yy_push_state():::EXIT0',
-    # we want 'yy_push_state'
-    else:
-        fnname = fnname[fnname.rfind('.')+1:fnname.find('(')]
+# From Python, load this with daikon_io.LoadScript('dfec-to-kvasir-dtrace')
+# and call ReadKvasirDecls() once and ConvertDtrace() for each .dtrace file
+# (or ConvertBatch() for all of them).
 
-    # Just return 'ENTER' or 'EXIT' with no numbers
-    # (This means that we can only keep one exit ppt)
-    if enterOrExit[1] == 'N':
-        enterOrExit = 'ENTER'
-    else:
-        enterOrExit = 'EXIT'
-
-    # Return a pair of the function name and 'ENTER' or 'EXITxxx'
-    return (fnname, enterOrExit)
-
-
-# .decls States:
-# About to read in ...
-# 0 = Nothing important
-# 1 = program point name
-# 2 = variable name
-# 3 = variable declared type
-# 4 = variable rep. type
-# 5 = variable comparability number - VERY important
-class DeclsState:
-    Uninit, PptName, VarName, DecType, RepType, CompNum = range(6)
-
-curVarMap = 0 # The current variable map
-curVarName = ""
-
-# Key: program point name (stripped using StripKvasirPptName)
-# Value: A list of 2 elts: car: full ppt name
-#                          cdr: A list of lists,
-#                               where each sub-list is: [variable name, rep. type]
-KvasirPptMap = {}
-
-myState = DeclsState.Uninit
-
-for line in kvasirDeclsAllLines:
-
-    if myState == DeclsState.Uninit:
-
-        # The program point name always follows the
-        # line called "DECLARE"
-        if line == "DECLARE":
-            myState = DeclsState.PptName
-
-    elif myState == DeclsState.PptName:
-        curVarList = []
-        KvasirPptMap[StripKvasirPptName(line)] = [line, curVarList]
-        myState = DeclsState.VarName
-
-    elif myState == DeclsState.VarName:
-        if line == "DECLARE":
-            myState = DeclsState.PptName
-        elif line == "":
-            myState = DeclsState.Uninit
+import sys
+import os
+import time
+from cStringIO import StringIO
+from daikon_io import (MappedRecords, OpenOutput, SplitRecords,
+                       IsSplittable, LoadScript)
+from daikon_cache import CachedDecls, DefaultCacheDir
+from daikon_stats import Stats, OpenStats, CloseStats, TimePhase
+from daikon_format import ReadDtrace, StripKvasirPptName, RenameExit
+from daikon_names import (DfecVarNames, KvasirVarNames, DfecPptNames,
+                          CountNameCaches)
+
+# See daikon_format.py for the differences between Dfec and Kvasir
+# variable and program point names.
+
+# A projection plan for a Kvasir program point says how to build its
+# .dtrace records out of Dfec ones.  It is a triple of
+#   (program point name line,
+#    [(Dfec variable name to look up, variable name line, is array), ...],
+#    set of all the Dfec variable names to look up)
+# with one list entry per Kvasir variable, in declaration order.  All of it
+# depends only on the Kvasir .decls file, so it is compiled once per
+# program point instead of for every .dtrace record.
+def CompilePlan(kvasirPpt):
+    steps = []
+
+    for var in kvasirPpt.vars:
+        varName = var.name
+        repType = var.repType or ''
+
+        # Try to look up varName in the varInfo dict., remembering
+        # the differences between Kvasir and Dfec names:
+
+        # If repType == "java.lang.String", then look
+        # up the entry for the variable + '[]' because
+        # Dfec has separate variables for the pointer
+        # and content of strings
+        varToLookup = varName
+        if "java.lang.String" in repType:
+            varToLookup += '[]'
+
+        steps.append((KvasirVarNames.Convert(varToLookup), varName + '\n',
+                      repType[-2:] == '[]'))
+
+    return (kvasirPpt.name + '\n', steps,
+            frozenset([step[0] for step in steps]))
+
+# Returns a map where the keys are program point names (stripped using
+# StripKvasirPptName) and the values are the projection plans of the
+# Ppts declared in the Kvasir .decls file f (a path or a file object).
+# Kvasir's own exits (EXIT0) have the key (function, 'EXIT'); numbered
+# ones, which only come from dfec-to-kvasir.py --exits all, keep their
+# numbers.
+# The parsed .decls file is cached in cacheDir if it is given.
+def ReadKvasirDecls(f, cacheDir=None):
+    KvasirPptMap = {}
+
+    for ppt in CachedDecls(f, False, cacheDir):
+        fnname, enterOrExit = StripKvasirPptName(ppt.name, keepExitId=True)
+        if enterOrExit == 'EXIT0':
+            enterOrExit = 'EXIT'
+        KvasirPptMap[(fnname, enterOrExit)] = CompilePlan(ppt)
+
+    return KvasirPptMap
+
+
+# Writes the Kvasir version of one Dfec .dtrace record to out, where
+# varInfo maps the (converted) Dfec variable names of the record to
+# [value, modbit] lists.  Returns a pair of (the number of bytes
+# written, the number of variables that were missing from the record).
+def ProjectRecord(plan, varInfo, out):
+    nameLine, steps, lookupKeys = plan
+    output = [nameLine]
+    copOuts = 0
+
+    # Go thru all variables in .decls file (to preserve order) and
+    # print out the corresponding entries in the .dtrace file:
+    for (varToLookup, varLine, isArray) in steps:
+        stuff = varInfo.get(varToLookup)
+        if stuff is not None:
+            value = stuff[0]
+            if isArray and value[:1] != '[' and value != "uninit" and value != "nonsensical":
+                output.append(varLine + '[ ' + value + ' ]\n' + stuff[1] + '\n')
+            else:
+                output.append(varLine + value + '\n' + stuff[1] + '\n')
+        # Total cop out ... print blank
+        else:
+            output.append(varLine + 'uninit\n2\n')
+            copOuts += 1
+
+    # Blank line ends this ppt
+    output.append('\n')
+    text = ''.join(output)
+    out.write(text)
+    return (len(text), copOuts)
+
+# Converts the Dfec .dtrace file f (a path or a file object), or the
+# records in it between byte offsets start and end, and writes the
+# result to out, using the map returned by ReadKvasirDecls().  If index
+# is given, f is a path and index is its index from dtrace-index.py,
+# and only the records that are needed are read.
+# If stats (a daikon_stats.Stats) is given, the time spent reading
+# records, matching their variables and writing them out is added to
+# it, along with counts of matched and unmatched records and program
+# points.
+# exits is one of EXIT_POLICIES (see the top of this file).
+EXIT_POLICIES = ['merge', 'all']
+
+def ConvertDtrace(KvasirPptMap, f, out, start=0, end=None, index=None,
+                  stats=None, exits='merge'):
+    # Key: Dfec program point name, as it appears in the .dtrace file
+    # Value: None if it is not in the Kvasir .decls file, or else a pair
+    #        of (the plan of the matching Kvasir program point,
+    #            a map from each Dfec variable name line seen in its
+    #            records to the plan's lookup key for it, or None if
+    #            the plan never reads that variable)
+    pptCache = {}
+
+    def LookupPpt(pptName):
+        if pptName in pptCache:
+            return pptCache[pptName]
+        fnname, enterOrExit = DfecPptNames.Convert(pptName)
+        if enterOrExit == 'ENTER':
+            plan = KvasirPptMap.get((fnname, enterOrExit))
+        elif exits == 'all' and (fnname, enterOrExit) in KvasirPptMap:
+            plan = KvasirPptMap[(fnname, enterOrExit)]
         else:
-            curVarList.append([])
-            curVarList[-1].append(line)
-            myState = DeclsState.DecType
-
-    elif myState == DeclsState.DecType:
-#        curVarList[-1].append(line)
-        myState = DeclsState.RepType
-
-    elif myState == DeclsState.RepType:
-        curVarList[-1].append(line)
-        myState = DeclsState.CompNum
-
-    elif myState == DeclsState.CompNum:
-#        curVarList[-1].append(line)
-
-        # Assume we are gonna read another variable.
-        # When we actually read the subsequent line,
-        # we'll branch according to whether it's a real
-        # variable or another thing
-        myState = DeclsState.VarName
-
-
-def processPpt(pptName, varInfo):
-    # First check if this ppt is in the Kvasir .decls file
-    # by munging its name, and if so, print out the Kvasir
-    # version of the name
-    stripped = StripDfecPptName(pptName)
-
-    if stripped in KvasirPptMap:
-        print KvasirPptMap[stripped][0]
-
-        # Iterate thru all variables in .decls file (to preserve
-        # order) and print ut the corresponding entries in the .dtrace
-        # file:
-        varList = KvasirPptMap[stripped][1]
-        for varEntry in varList:
-            varName = varEntry[0]
-            repType = varEntry[1]
-
-            # Try to look up varName in the varInfo dict., remembering
-            # the differences between Kvasir and Dfec names:
-
-            # If repType == "java.lang.String", then look
-            # up the entry for the variable + '[]' because
-            # Dfec has separate variables for the pointer
-            # and content of strings
-            varToLookup = varName
-            if "java.lang.String" in repType:
-                varToLookup += '[]'
-
-            varToLookup = ConvertKvasirVarName(varToLookup)
-
-            if varToLookup in varInfo:
-                stuff = varInfo[varToLookup]
-                print varName
-
-                if repType[-2:] == '[]' and stuff[0][0] != '[' and stuff[0] != "uninit" and stuff[0] != "nonsensical":
-                    print '[', stuff[0], ']'
-                else:
-                    print stuff[0]
-
-                print stuff[1]
-            # Total cop out ... print blank
+            plan = KvasirPptMap.get((fnname, 'EXIT'))
+            if plan is not None and exits == 'all':
+                # The plan for EXIT0, but named after the Dfec exit
+                plan = (RenameExit(plan[0][:-1], enterOrExit) + '\n',
+                        plan[1], plan[2])
+        if plan is None:
+            entry = None
+        else:
+            entry = (plan, {})
+        pptCache[pptName] = entry
+        return entry
+
+    # The number of records that were skipped (in a list so that
+    # IsWanted() can change it)
+    numSkipped = [0]
+
+    # Decides from the first line of a record whether it is worth
+    # reading: records of program points that Kvasir did not declare
+    # are skipped over whole
+    def IsWanted(line):
+        line = line.strip()
+        if ':::ENTER' not in line and ':::EXIT' not in line:
+            # Not a program point name; let ReadDtrace() look inside it
+            return True
+        if LookupPpt(line) is None:
+            numSkipped[0] += 1
+            return False
+        return True
+
+    if index is not None:
+        pptNames = []
+        for pptName in index:
+            if LookupPpt(pptName) is not None:
+                pptNames.append(pptName)
+            else:
+                numSkipped[0] += len(index[pptName][0])
+        records = LoadScript('dtrace-index').IndexedRecords(f, index, pptNames)
+    else:
+        records = MappedRecords(f, start, end, IsWanted)
+
+    # Counters for stats; the times are only taken if it is in use.
+    # time.clock() is the CPU time of this process.
+    timed = stats is not None
+    timer = time.time
+    clock = time.clock
+    numRecords = numBytes = numVars = numCopOuts = 0
+    readTime = matchTime = writeTime = 0.0
+    readCpu = matchCpu = writeCpu = 0.0
+    lastRecords = lastBytes = 0
+    if timed:
+        lastEnd = timer()
+        lastEndCpu = clock()
+
+    # The whole record is pulled out of the memory-mapped file in one
+    # piece, so only the lines that are actually used get stripped.
+    for (curPptName, nonce, fields) in ReadDtrace(records):
+        if timed:
+            matchStart = timer()
+            matchStartCpu = clock()
+            readTime += matchStart - lastEnd
+            readCpu += matchStartCpu - lastEndCpu
+
+        entry = LookupPpt(curPptName)
+        if entry is None:
+            numSkipped[0] += 1
+            if timed:
+                lastEnd = timer()
+                lastEndCpu = clock()
+                matchTime += lastEnd - matchStart
+                matchCpu += lastEndCpu - matchStartCpu
+            continue
+        plan, varKeys = entry
+
+        # For current program point only:
+        # Key: Variable name (after running through DfecVarNames)
+        # Value: list of 2 elts: [value, modbit]
+        # Only the variables that the plan reads are put in here.
+        VarInfo = {}
+
+        for i in range(0, len(fields) - 2, 3):
+            varLine = fields[i]
+            if varLine in varKeys:
+                key = varKeys[varLine]
             else:
-                print varName
-
-                print "uninit"
-
-                print "2"
-
-        # Blank line ends this ppt
-        print
-
-# .dtrace States:
-# About to read in ...
-# 0 = program point name or junk (uninit)
-# 1 = variable name
-# 2 = value
-# 3 = modbit
-# 4 = Ignore nonce
-class DtraceState:
-    Uninit, VarName, Value, Modbit, IgnoreNonce = range(5)
-
-dState = DtraceState.Uninit
-
-curPptName = ""
-# For current program point only:
-# Key: Variable name (after running through ConvertDfecVarName())
-# Value: list of 2 elts: [value, modbit]
-VarInfo = {}
-
-curVarName = None
-curVarInfo = None
-
-# This is shorthand for xreadlines so that it doesn't have to read the
-# entire file in at once, which is crucial for huge examples:
-for line in open(sys.argv[2], 'r'):
-    line = line.strip()
-
-    if dState == DtraceState.Uninit:
-        # Match program point name with ':::ENTER' or ':::EXIT'
-        if ':::ENTER' in line or ':::EXIT' in line:
-            curPptName = line
-            dState = DtraceState.VarName
-
-    elif dState == DtraceState.IgnoreNonce:
-        dState = DtraceState.VarName
-
-    elif dState == DtraceState.VarName:
-        if line == "this_invocation_nonce":
-            dState = DtraceState.IgnoreNonce
-        elif line == "":
-            # We've reached the end of a ppt entry!!!
-            # So process it
-            processPpt(curPptName, VarInfo)
-
-            curPptName = None
-            VarInfo = {}
-
-            dState = DtraceState.Uninit
+                key = DfecVarNames.Convert(varLine.strip())
+                if key not in plan[2]:
+                    key = None
+                varKeys[varLine] = key
+
+            if key is not None:
+                VarInfo[key] = [fields[i+1].strip(), fields[i+2].strip()]
+
+        if timed:
+            writeStart = timer()
+            writeStartCpu = clock()
+            matchTime += writeStart - matchStart
+            matchCpu += writeStartCpu - matchStartCpu
+
+        # We've reached the end of a ppt entry!!!
+        # So process it
+        recordBytes, recordCopOuts = ProjectRecord(plan, VarInfo, out)
+        numRecords += 1
+        numBytes += recordBytes
+        numVars += len(plan[1])
+        numCopOuts += recordCopOuts
+
+        if timed:
+            lastEnd = timer()
+            lastEndCpu = clock()
+            writeTime += lastEnd - writeStart
+            writeCpu += lastEndCpu - writeStartCpu
+            if numRecords & 1023 == 0:
+                stats.Progress(numRecords - lastRecords, numBytes - lastBytes)
+                lastRecords, lastBytes = numRecords, numBytes
+
+    if timed:
+        readTime += timer() - lastEnd
+        readCpu += clock() - lastEndCpu
+        stats.Progress(numRecords - lastRecords, numBytes - lastBytes)
+        stats.AddTime('trace parse', readTime, readCpu)
+        stats.AddTime('matching', matchTime, matchCpu)
+        stats.AddTime('output', writeTime, writeCpu)
+        stats.Count('records_matched', numRecords)
+        stats.Count('records_unmatched', numSkipped[0])
+        stats.Count('vars_written', numVars)
+        stats.Count('vars_copped_out', numCopOuts)
+        stats.AddNames('ppts_matched', [name for (name, entry) in pptCache.items()
+                                        if entry is not None])
+        stats.AddNames('ppts_unmatched', [name for (name, entry) in pptCache.items()
+                                          if entry is None])
+        CountNameCaches(stats)
+
+
+# The pieces of a .dtrace file are aimed at about this many bytes, so
+# that the converted output of the pieces that finish ahead of their
+# turn does not pile up in memory
+CHUNK_SIZE = 64 << 20
+
+# The map returned by ReadKvasirDecls(), for the workers of
+# ConvertDtraceParallel() and ConvertBatch() (which inherit it when
+# they are forked, so it is never pickled)
+workerPptMap = None
+
+# Worker for --jobs: converts the records in one byte range of a
+# .dtrace file and returns the result, along with a snapshot of its
+# stats if timed is True
+def ConvertChunk(chunk):
+    path, start, end, timed, exits = chunk
+    out = StringIO()
+    stats = None
+    if timed:
+        stats = Stats()
+    ConvertDtrace(workerPptMap, path, out, start, end, stats=stats, exits=exits)
+    return (out.getvalue(), stats and stats.Snapshot())
+
+# Converts the Dfec .dtrace file at path like ConvertDtrace(), but in
+# jobs worker processes.  The file is split into pieces at record
+# boundaries, and the converted pieces are written to out in their
+# original order.  The stats of the workers are added to stats if it
+# is given.
+def ConvertDtraceParallel(KvasirPptMap, path, out, jobs, stats=None,
+                          exits='merge'):
+    global workerPptMap
+
+    # Set this before starting any workers so that they inherit it
+    workerPptMap = KvasirPptMap
+
+    import multiprocessing
+    # (The workers drop the name cache counts that they inherit, which
+    # are counted here)
+    pool = multiprocessing.Pool(jobs, CountNameCaches)
+    try:
+        # Use a few more chunks than workers to even out the load
+        numChunks = max(jobs * 4, os.path.getsize(path) // CHUNK_SIZE + 1)
+        chunks = [(path, start, end, stats is not None, exits)
+                  for (start, end) in SplitRecords(path, numChunks)]
+        for (result, snapshot) in pool.imap(ConvertChunk, chunks):
+            out.write(result)
+            if stats is not None:
+                stats.Merge(snapshot)
+    finally:
+        pool.close()
+        pool.join()
+        workerPptMap = None
+
+# Converts the whole Dfec .dtrace file at path like ConvertDtrace(),
+# through its index (see dtrace-index.py) if useIndex is True and the
+# file can be indexed
+def ConvertWhole(KvasirPptMap, path, out, useIndex=False, stats=None,
+                 exits='merge'):
+    index = None
+    if useIndex and IsSplittable(path):
+        index = LoadScript('dtrace-index').LoadIndex(path)
+    ConvertDtrace(KvasirPptMap, path, out, index=index, stats=stats, exits=exits)
+
+# Worker for --output-dir: converts one whole .dtrace file into another
+# and returns a snapshot of its stats if timed is True
+def ConvertFile(task):
+    inPath, outPath, useIndex, timed, exits = task
+    out = OpenOutput(outPath)
+    stats = None
+    if timed:
+        stats = Stats()
+    ConvertWhole(workerPptMap, inPath, out, useIndex, stats, exits)
+    out.close()
+    return stats and stats.Snapshot()
+
+# Converts each Dfec .dtrace file in pairs, a list of (input path,
+# output path), with the same KvasirPptMap.  With jobs > 1 the files
+# are converted in jobs worker processes, one file per worker at a
+# time.  useIndex and exits are passed on to ConvertWhole(), and the
+# stats of each file are added to stats if it is given.
+def ConvertBatch(KvasirPptMap, pairs, jobs=1, useIndex=False, stats=None,
+                 exits='merge'):
+    global workerPptMap
+
+    # Set this before starting any workers so that they inherit it
+    workerPptMap = KvasirPptMap
+    tasks = [(inPath, outPath, useIndex, stats is not None, exits)
+             for (inPath, outPath) in pairs]
+    try:
+        if jobs > 1 and len(tasks) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(jobs, len(tasks)), CountNameCaches)
+            try:
+                snapshots = pool.imap_unordered(ConvertFile, tasks)
+                for snapshot in snapshots:
+                    if stats is not None:
+                        stats.Merge(snapshot)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            curVarName = line
-            curVarInfo = []
-            dState = DtraceState.Value
-
-    elif dState == DtraceState.Value:
-        curVarInfo.append(line)
-        dState = DtraceState.Modbit
-
-    elif dState == DtraceState.Modbit:
-        curVarInfo.append(line)
-        VarInfo[ConvertDfecVarName(curVarName)] = curVarInfo
-        curVarName = None
-        curVarInfo = None
-        dState = DtraceState.VarName
+            for task in tasks:
+                snapshot = ConvertFile(task)
+                if stats is not None:
+                    stats.Merge(snapshot)
+    finally:
+        workerPptMap = None
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(usage="dfec-to-kvasir-dtrace.py [--jobs N] [--index] [--exits POLICY] [--output FILE | --output-dir DIR] [--decls-cache DIR] [--stats FILE [--stats-interval SECONDS]] kvasir-decls-file dfec-dtrace-file ...")
+    parser.add_argument('declsFile')
+    parser.add_argument('dtraceFiles', nargs='+')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes to use")
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="write the .dtrace file to FILE instead of stdout")
+    parser.add_argument('-d', '--output-dir', metavar='DIR',
+                        help="write each .dtrace file to a file with the same name in DIR")
+    parser.add_argument('--index', action='store_true',
+                        help="read only the needed records, through the .dtrace file's index")
+    parser.add_argument('--exits', choices=EXIT_POLICIES, default='merge',
+                        help="write the records of Dfec's numbered exits as EXIT0 (merge) or under their own names (all) (default: merge)")
+    parser.add_argument('--decls-cache', metavar='DIR', default=DefaultCacheDir(),
+                        help="cache the parsed .decls file in DIR")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="write timing and throughput numbers as JSON to FILE ('-' for stderr)")
+    parser.add_argument('--stats-interval', metavar='SECONDS', type=float, default=10.0,
+                        help="write a progress line to the --stats file this often")
+    args = parser.parse_args(argv[1:])
+
+    if args.output_dir is not None:
+        if args.output is not None:
+            parser.error("--output and --output-dir can't be used together")
+        pairs = []
+        for path in args.dtraceFiles:
+            outPath = os.path.join(args.output_dir, os.path.basename(path))
+            if os.path.exists(outPath) and os.path.samefile(path, outPath):
+                parser.error("%s would be overwritten by its own output" % path)
+            if outPath in [o for (i, o) in pairs]:
+                parser.error("more than one input would be written to %s" % outPath)
+            pairs.append((path, outPath))
+        if not os.path.isdir(args.output_dir):
+            os.makedirs(args.output_dir)
+    elif len(args.dtraceFiles) > 1:
+        parser.error("converting several .dtrace files needs --output-dir")
+
+    stats = OpenStats(args.stats, args.stats_interval)
+
+    with TimePhase(stats, 'decls parse'):
+        KvasirPptMap = ReadKvasirDecls(args.declsFile, args.decls_cache)
+
+    with TimePhase(stats, 'convert'):
+        if args.output_dir is not None:
+            ConvertBatch(KvasirPptMap, pairs, args.jobs, args.index, stats,
+                         args.exits)
+        else:
+            dtraceFile = args.dtraceFiles[0]
+            out = OpenOutput(args.output)
+            # Pipes and compressed files can't be split up, so they are
+            # always converted serially
+            if args.jobs > 1 and not args.index and IsSplittable(dtraceFile):
+                ConvertDtraceParallel(KvasirPptMap, dtraceFile, out, args.jobs, stats,
+                                      args.exits)
+            else:
+                ConvertWhole(KvasirPptMap, dtraceFile, out, args.index, stats,
+                             args.exits)
+            out.close()
+
+    if stats is not None:
+        stats.Count('kvasir_ppts', len(KvasirPptMap))
+        stats.Count('input_bytes', sum([os.path.getsize(path) for path in args.dtraceFiles
+                                        if os.path.isfile(path)]))
+        CountNameCaches(stats)
+    CloseStats(stats)
+
+if __name__ == '__main__':
+    main(sys.argv)
 
 
 ##ResultMap = {}
@@ -24,6 +24,10 @@
 # Usage: (Takes in 7 filenames as params.  The first 2 files are inputs
 #         and the latter 5 are outputs.)
 # ./Lackwit2DynComp.py dfec-produced.decls kvasir-produced.decls kvasir-with-lackwit.decls kvasir-with-dyncomp.decls kvasir-with-declared-types.decls kvasir-no-comp.decls intersection.vars
+#
+# To only produce some of the outputs, name them with options instead:
+# ./dfec-to-kvasir.py [--lackwit FILE] [--dyncomp FILE] [--dec-types FILE] [--no-comp FILE] [--vars FILE] dfec-produced.decls kvasir-produced.decls
+# The outputs that are left out are not computed at all.
 
 # If everything goes correctly, kvasir-with-lackwit.decls and
 # kvasir-with-dyncomp.decls should only differ in their comparability
@@ -32,491 +36,526 @@
 # should be compatible with the resulting .dtrace file so that Daikon
 # can run on both sets of output.
 
-import sys
-
-# Process command-line args:
-dfecF = open(sys.argv[1], 'r')
-DfecAllLines = [line.strip() for line in dfecF.readlines()]
-dfecF.close()
-
-kvasirF = open(sys.argv[2], 'r')
-KvasirAllLines = [line.strip() for line in kvasirF.readlines()]
-kvasirF.close()
-
-outputLackwitDeclsF = open(sys.argv[3], 'w')
-outputDynCompDeclsF = open(sys.argv[4], 'w')
-
-outputDecTypesDeclsF = open(sys.argv[5], 'w')
-outputNoCompDeclsF = open(sys.argv[6], 'w')
-
-outputVarsF = open(sys.argv[7], 'w')
-
-
-
-import re
-DfecGlobalRE = re.compile('^::')
-
-# Dfec and Kvasir variable differences:
-
-# Globals are prefixed with a '::' in Dfec
-# and with a '/' in Kvasir
-
-# Dfec doesn't append the filename in front of
-# file-static global variables like Kvasir does
+# Dfec numbers the exits of a function (EXIT1, EXIT2, ...) but Kvasir
+# only has EXIT0.  --exits POLICY picks how they are matched up (see
+# EXIT_POLICIES below): by default the last exit that Dfec declares is
+# used, as this script always did; 'all' writes one exit program point
+# per Dfec exit, named after it.
 
-# Dfec also doesn't print out function-static variables
-# while Kvasir does
+# --coverage FILE writes a report of the program points and variables
+# that only one of the .decls files has as JSON to FILE ('-' for
+# stderr; see CoverageReport below).  It comes out of the same pass
+# that matches them up.
 
-# Dfec derives two Daikon variables for strings
-# one for the pointer and the other for the contents,
-# while Kvasir only has one for the contents.
+# --stats FILE writes the time taken by each phase, counts of the
+# matched and unmatched program points and variables, and the hit rates
+# of the variable name caches (see daikon_names.py) as JSON to FILE
+# ('-' for stderr; see daikon_stats.py).
 
-# Dfec uses the arrow notation for struct names while
-# Kvasir uses the bracket notation (unless disambiguation
-# information is provided)
-
-# Converts variable var's name from Dfec conventions
-# to Kvasir conventions and returns it as the result
-def ConvertDfecVarName(var):
-    globalConverted = DfecGlobalRE.sub('/', var)
-    return globalConverted.replace('->', '[].')
-
-# Ok, we are going to just strip off everything before
-# the '/', if there is one, because Dfec does not print
-# out the function name for function-static variables
-# e.g. 'flex_c@epsclosure/did_stk_init' becomes '/did_stk_init'
-def ConvertKvasirVarName(var):
-    if var[0] == '/':
-        return var
-    elif '/' in var:
-        return '/' + var.split('/')[1]
-    else:
-        return var
-
-# Kvasir does not support comparability for array indices
-# so strip those off.
-# e.g. '104[105]' becomes '104'
-def StripCompNumber(comp_num):
-    if '[' in comp_num:
-        return comp_num[:comp_num.find('[')]
-    else:
-        return comp_num
-
-# Dfec and Kvasir program point name differences:
-
-# Global program point names in Dfec are prefixed by 'std.'
-# while they are prefixed by '..' in Kvasir
-
-# Dfec uses 'EXIT1' while Kvasir uses 'EXIT0' for the exit
-# so we should probably simply search for 'EXIT' without
-# regard to the number behind it.  However, Dfec can have
-# more than 1 exit while Kvasir can only have 1.  Hmmm,
-# what do we do about that?
-# (Right now, we just keep 'EXIT' without the number before
-#  putting it in the hashtable.  Thus, only one EXIT ppt
-#  is kept for each function ... I'm just not sure which
-#  one, though, but that's ok)
-
-# Dfec's names for C functions have crap in between the parens
-# while Kvasir's doesn't.  Let's just not worry about what's
-# in the parens since C doesn't have overloading.  We just want
-# to strip off the canonical function name.
-
-# Strips the extraneous stuff off of Dfec's names and returns
-# a 2-tuple of ppt name and either 'ENTER' or 'EXITxxx'
-
-# Input:  'std.ccladd(int;int;)void:::ENTER'
-# Output: ('ccladd', 'ENTER')
-
-def StripDfecPptName(ppt):
-    fnname, enterOrExit = ppt.split(':::')
-    if fnname[:4] == 'std.':
-        fnname = fnname[4:]
-    # Find the first '(' and end the function name there
-    fnname = fnname[:fnname.index('(')]
-
-    # Just return 'ENTER' or 'EXIT' with no numbers
-    # (This means that we can only keep one exit ppt)
-    if enterOrExit[1] == 'N':
-        enterOrExit = 'ENTER'
-    else:
-        enterOrExit = 'EXIT'
-
-    # Return a pair of the function name and 'ENTER' or 'EXITxxx'
-    return (fnname, enterOrExit)
-
-
-def StripKvasirPptName(ppt):
-    fnname, enterOrExit = ppt.split(':::')
-
-    # For globals, grab everything from '..' to '('
-    # e.g. for '..main():::ENTER'
-    # we want 'main'
-    if fnname[:2] == '..':
-        fnname = fnname[2:fnname.find('(')]
-
-    # For file-static names, we need to take everything between
-    # the LAST period ('.') and the '('
-    # e.g. for 'flex.c.yy_push_state():::EXIT0',
-    # we want 'yy_push_state'
-    else:
-        fnname = fnname[fnname.rfind('.')+1:fnname.find('(')]
-
-    # Just return 'ENTER' or 'EXIT' with no numbers
-    # (This means that we can only keep one exit ppt)
-    if enterOrExit[1] == 'N':
-        enterOrExit = 'ENTER'
-    else:
-        enterOrExit = 'EXIT'
+# If $DAIKON_DECLS_CACHE names a directory, the parsed .decls files are
+# kept there so that later runs on the same files skip parsing them
+# (see daikon_cache.py).
 
-    # Return a pair of the function name and 'ENTER' or 'EXITxxx'
-    return (fnname, enterOrExit)
+import sys
+import time
+import json
+from json.encoder import encode_basestring_ascii
+from daikon_io import CreateFile
+from daikon_cache import CachedDecls, DefaultCacheDir
+from daikon_stats import OpenStats, CloseStats, TimePhase
+from daikon_format import (StripCompNumber, StripDfecPptName,
+                           StripKvasirPptName, RenameExit, DecTypeCompNums)
+from daikon_names import DfecVarNames, KvasirVarNames, CountNameCaches
 
+# From Python, load this with daikon_io.LoadScript('dfec-to-kvasir') and
+# call DfecToKvasir() with file objects (or the routines it is made of).
 
-# States:
-# About to read in ...
-# 0 = Nothing important
-# 1 = program point name
-# 2 = variable name
-# 3 = variable declared type
-# 4 = variable rep. type
-# 5 = variable comparability number - VERY important
-class State:
-    Uninit, PptName, VarName, DecType, RepType, CompNum = range(6)
 
-myState = State.Uninit
+# See daikon_format.py for the differences between Dfec and Kvasir
+# variable and program point names.
 
 
-# Run the state machine to build up a map (DfecPptMap)
+# Returns a map (DfecPptMap)
 # where the keys are program point names (stripped using StripDfecPptName)
 # and the values are maps where the keys are variable names and the
 # values are comparability numbers
-DfecPptMap = {}
-
-curVarMap = 0 # The current variable map
-curVarName = ""
-
-for line in DfecAllLines:
-
-    if myState == State.Uninit:
-
-        # The program point name always follows the
-        # line called "DECLARE"
-        if line == "DECLARE":
-            myState = State.PptName
-
-    elif myState == State.PptName:
+# This is the only thing that is kept in memory for the whole run, so
+# its strings are interned: the same variable names and comparability
+# numbers come up at many program points.
+# Dfec can have several exits per function (EXIT1, EXIT2, ...) while
+# Kvasir only has EXIT0, so exits is one of EXIT_POLICIES:
+#  'last':  the key is (function, 'EXIT') and the exit that was declared
+#           last is kept (what this script has always done)
+#  'first': the key is (function, 'EXIT') and the exit that was
+#           declared first is kept
+#  'merge': the key is (function, 'EXIT') and the variables of all of
+#           the exits are kept; a variable at more than one exit keeps
+#           the comparability number of the first one
+#  'all':   the key is (function, 'EXITn') for each exit, and Kvasir's
+#           EXIT0 is matched with each of them (see IndexExits())
+EXIT_POLICIES = ['last', 'first', 'merge', 'all']
+
+def ReadDfecDecls(f, cacheDir=None, exits='last'):
+    DfecPptMap = {}
+
+    for ppt in CachedDecls(f, False, cacheDir):
         curVarMap = {}
-        DfecPptMap[StripDfecPptName(line)] = curVarMap
-        myState = State.VarName
-
-    elif myState == State.VarName:
-        if line == "DECLARE":
-            myState = State.PptName
-        elif line == "":
-            myState = State.Uninit
-        else:
-            curVarName = ConvertDfecVarName(line)
-            myState = State.DecType
-
-    elif myState == State.DecType:
-        myState = State.RepType
-
-    elif myState == State.RepType:
-        myState = State.CompNum
-
-    elif myState == State.CompNum:
-        # strip off array index comparability numbers
-        # e.g. '217[337]' should become '217'
-        curVarMap[curVarName] = StripCompNumber(line)
-
-        # Assume we are gonna read another variable.
-        # When we actually read the subsequent line,
-        # we'll branch according to whether it's a real
-        # variable or another thing
-        myState = State.VarName
+        varNames = DfecVarNames.ConvertAll([var.name for var in ppt.vars])
+        for (varName, var) in zip(varNames, ppt.vars):
+            # strip off array index comparability numbers
+            # e.g. '217[337]' should become '217'
+            curVarMap[varName] = intern(StripCompNumber(var.comp or ''))
+
+        fnname, enterOrExit = StripDfecPptName(ppt.name, keepExitId=True)
+        if enterOrExit != 'ENTER' and exits != 'all':
+            enterOrExit = 'EXIT'
+        key = (intern(fnname), intern(enterOrExit))
+
+        if enterOrExit != 'EXIT' or exits == 'last' or key not in DfecPptMap:
+            DfecPptMap[key] = curVarMap
+        elif exits == 'merge':
+            mergedVarMap = DfecPptMap[key]
+            for (var, comp) in curVarMap.iteritems():
+                mergedVarMap.setdefault(var, comp)
+
+    return DfecPptMap
+
+# For the 'all' exit policy: returns a map from each function name in
+# DfecPptMap to the keys of its exits, in order of their numbers
+def IndexExits(DfecPptMap):
+    exitMap = {}
+    for key in DfecPptMap:
+        if key[1] != 'ENTER':
+            exitMap.setdefault(key[0], []).append(key)
+    for keys in exitMap.values():
+        keys.sort(key=lambda k: (len(k[1]), k[1]))
+    return exitMap
+
+# Returns a list of (program point name, Dfec key) pairs for the Kvasir
+# program point ppt: one for the Dfec program point that it matches, no
+# pairs if there is none, or, for an exit with the 'all' exit policy
+# (if exitMap is the map from IndexExits()), one for each of the Dfec
+# exits of the function, named after them (e.g. '..f():::EXIT2')
+def MatchPpt(DfecPptMap, ppt, exitMap=None):
+    key = StripKvasirPptName(ppt)
+    if exitMap is not None and key[1] == 'EXIT':
+        return [(RenameExit(ppt, dfecKey[1]), dfecKey)
+                for dfecKey in exitMap.get(key[0], [])]
+    elif key in DfecPptMap:
+        return [(ppt, key)]
+    else:
+        return []
 
 
-# Key: program point name
-# Value: A list of 5-element sub-lists
+# Yields a (program point name, variable list) pair for each program
+# point in the Kvasir .decls file f, in the order they were read in,
+# where the variable list is a list of 5-element sub-lists
 #          Each sub-list is:
 #            (variable name, decType, repType, kvasirCompNum, declaredTypeCompNum)
-# declaredTypeCompNum is calculated later in the next step by assigning
-# each variable of the same declared type at a particular program point
-# the SAME number
-KvasirPptMap = {}
-
-# A list of the same strings which are keys to KvasirPptMap
-# This is desirable because we want to output the program points
-# in the same order as they were read in
-KvasirPptNames = []
-
-myState = State.Uninit
-
-for line in KvasirAllLines:
-
-    if myState == State.Uninit:
-
-        # The program point name always follows the
-        # line called "DECLARE"
-        if line == "DECLARE":
-            myState = State.PptName
-
-    elif myState == State.PptName:
-        curVarList = []
-        # Remember to add an entry to both the list and the map
-        KvasirPptNames.append(line)
-        KvasirPptMap[line] = curVarList
-        myState = State.VarName
-
-    elif myState == State.VarName:
-        if line == "DECLARE":
-            myState = State.PptName
-        elif line == "":
-            myState = State.Uninit
-        else:
-            curVarList.append([])
-            curVarList[-1].append(line)
-            myState = State.DecType
-
-    elif myState == State.DecType:
-        curVarList[-1].append(line)
-        myState = State.RepType
-
-    elif myState == State.RepType:
-        curVarList[-1].append(line)
-        myState = State.CompNum
-
-    elif myState == State.CompNum:
-        curVarList[-1].append(line)
-
-        # Assume we are gonna read another variable.
-        # When we actually read the subsequent line,
-        # we'll branch according to whether it's a real
-        # variable or another thing
-        myState = State.VarName
-
-
-# Strips all comments after #
-# space-delimited token:
-# Input:  int # isParam=true
-# Output: int
-def StripComments(comp_num):
-    return comp_num.split('#')[0].strip()
-
-
-# Now we are going to initialize the declaredTypeCompNum of each entry
-# within KvasirPptMap.  All variables with identical declared type
-# strings will have the same comparability number at each program
-# point.
-for ppt in KvasirPptMap:
-    curCompNum = 1 # Start at 1 and monotonically increase
-
-    # Key: declared type; Value: comp. num associated with that type
-    decTypesMap = {}
-
-    curVarList = KvasirPptMap[ppt]
-
-    for elt in curVarList:
-        curDecType = StripComments(elt[1])
-        if curDecType in decTypesMap:
-            elt.append(decTypesMap[curDecType]) # Use the stored comp. num
-        else:
-            elt.append(curCompNum) # Use a fresh new comp. num
-            decTypesMap[curDecType] = curCompNum # and add the entry to the map
-            curCompNum += 1 # Don't forget to increment this!
-
-
-# Now both DfecPptMap and KvasirPptMap should be initialized.  We want
-# to now iterate through KvasirPptMap, translate program
-# point/variable names to the names that will appear in DfecPptMap,
-# look up the appropriate entries, and add them to ResultMap, which
-# contains all program points and variables that are present in BOTH
-# the Dfec and Kvasir-generated .decls files.
+# declaredTypeCompNum is calculated by assigning each variable of the
+# same declared type at a particular program point the SAME number
+# Only one program point is read in at a time, whether or not the
+# .decls file comes out of the cache in cacheDir.
+def ReadKvasirPpts(f, cacheDir=None):
+    for ppt in CachedDecls(f, False, cacheDir):
+        yield (ppt.name,
+               [[var.name, var.decType or '', var.repType or '',
+                 var.comp or '', decTypeCompNum]
+                for (var, decTypeCompNum)
+                in zip(ppt.vars, DecTypeCompNums(ppt.vars))])
+
+# We want to translate the program point/variable names of each Kvasir
+# program point to the names that will appear in DfecPptMap, look up
+# the appropriate entries, and keep the program points and variables
+# that are present in BOTH the Dfec and Kvasir-generated .decls files.
 
 # Remember that our goal is to output a Kvasir-compatible .decls file
 # with the variables and comparability numbers gathered from the
 # Dfec-generated .decls file to outputLackwitDeclsF and one with
 # the numbers gathered from DynComp to outputDynCompDeclsF.
 
-
-ResultMap = {}
-
-for ppt in KvasirPptMap:
-    stripped = StripKvasirPptName(ppt)
-    if stripped in DfecPptMap:
-        KvasirVarList = KvasirPptMap[ppt]
-        DfecVarMap = DfecPptMap[stripped]
-
-#        print "KvasirVarList:"
-#        print KvasirVarList
-#        print "DfecVarMap:"
-#        print DfecVarMap
-#        print
-#        print
-
-        curResultVarList = []
-
-#        print ppt
-
-        # Now iterate through the Kvasir variable list:
-        for entry in KvasirVarList:
-            var = entry[0]
-            decType = entry[1]
-            repType = entry[2]
-            kvasirCompNum = entry[3]
-            decTypeCompNum = entry[4]
-
-            # If repType == "java.lang.String", then look
-            # up the entry for the variable + '[]' because
-            # Dfec has separate variables for the pointer
-            # and content of strings
-            varToLookup = var
-            if repType == "java.lang.String":
-                varToLookup += '[]'
-
-            varToLookup = ConvertKvasirVarName(varToLookup)
-
-            if varToLookup in DfecVarMap:
-                # Throw the comparability number on the end
-                # of the entry for that variable
-
-                # Make this a tuple 'cause it should be immutable:
-                # Each entry should be the following:
-                #  (variable name, dec. type, rep. type,
-                #           (Lackwit comp. num, Kvasir comp. num, dec. type comp num)
-                curResultVarList.append((var, decType, repType,
-                                         (DfecVarMap[varToLookup],
-                                          kvasirCompNum,
-                                          decTypeCompNum)))
-                if DfecVarMap[varToLookup] == "":
-                    print "EMPTY COMP. NUMBER!", var, varToLookup
-
-                # Only for debugging
-#                DfecVarMap.pop(varToLookup)
-
-        ResultMap[ppt] = curResultVarList
-
-# This is important to see how much of the intersection between
-# Dfec and Kvasir variables that we've successfully picked up:
-
-#        print "Leftovers", DfecVarMap.keys()
-#        print "# vars in Dfec:  ", len(DfecVarMap.keys())
-#        print "# vars in Kvasir:", len(KvasirVarList)
-#        print "# vars in result:", len(curResultVarList)
-#        print
-
-# Output the resulting .decls file and the var list file:
-
-# Globals section ... let's just take the first program point and use
-# the global vars in that one for the globals section.  This makes the
-# assumption that the same global variables appear everywhere at all
-# program points ... will have to investigate further later ...
-
-outputVarsF.write("----SECTION----\n")
-outputVarsF.write("globals\n")
-
-exampleVarList = ResultMap[KvasirPptNames[0]]
-
-for varEntry in exampleVarList:
-    if '/' in varEntry[0]: # only print out globals and file-statics
-        outputVarsF.write(varEntry[0])
-        outputVarsF.write("\n")
-
-outputVarsF.write("\n")
-
-
-# Filter KvasirPptNames to remove any program points that are NOT
-# in the Dfec-generated .decls file:
-KvasirPptNames = [name for
-                  name in KvasirPptNames
-                  if (StripKvasirPptName(name) in DfecPptMap)]
-
-
-#
-
-outputNoCompDeclsF.write("VarComparability\nnone\n\n");
-
-
-allDeclsFiles = [outputLackwitDeclsF,
-                 outputDynCompDeclsF,
-                 outputDecTypesDeclsF,
-                 outputNoCompDeclsF]
-
-# Output the various .decls files
-# (Read these names from KvasirPptNames to preserve ordering)
-for ppt in KvasirPptNames:
-
-    for f in allDeclsFiles:
-        f.write("DECLARE\n")
-        f.write(ppt)
-        f.write("\n")
-
-    # Only print the :::EXIT program point to the var list file
-    # because then we can grab the return value 'return'
-
-    # Remember that we need to print program points in the form of
-    # '..main()' and NOT '..main():::ENTER' and '..main():::EXIT0'
-    isExit = False
-
-    fnname, enterOrExit = ppt.split(':::')
-    if enterOrExit[:4] == "EXIT":
-        isExit = True
-
-    if isExit:
-        outputVarsF.write("----SECTION----\n")
-        outputVarsF.write(fnname)
-        outputVarsF.write("\n")
-
-    for varEntry in ResultMap[ppt]:
-
-        for f in allDeclsFiles:
-            # Variable name
-            f.write(varEntry[0])
-            f.write("\n")
-
-            # Declared type
-            f.write(varEntry[1])
-            f.write("\n")
-
-            # Representation type
-            f.write(varEntry[2])
-            f.write("\n")
-
-        # Comparability number - this is where the action is!
-        # For Lackwit, we choose the car of the tuple,
-        outputLackwitDeclsF.write(varEntry[3][0])
-        # For DynComp, we choose the cadr
-        outputDynCompDeclsF.write(varEntry[3][1])
-        # For dec. type, we choose the caddr
-        outputDecTypesDeclsF.write(str(varEntry[3][2]))
-        # For no comparability, simply print out '22'
-        outputNoCompDeclsF.write("22")
-
-        for f in allDeclsFiles:
-            f.write("\n")
-
-        # Don't print out globals or file-static vars in the
-        # var-list-file for individual program points
-        if isExit and not ('/' in varEntry[0]):
-            outputVarsF.write(varEntry[0])
-            outputVarsF.write("\n")
-
-    # Newline separating neighboring program points
-    for f in allDeclsFiles:
-        f.write("\n")
-
-    if isExit:
-        outputVarsF.write("\n")
-
-
-#print '# Dfec ppts:', len(DfecPptMap.keys())
-#print '# Kvasir ppts:', len(KvasirPptMap.keys())
-#print '# Common ppts:', len(ResultMap.keys())
-
-
-
-for f in allDeclsFiles:
-    f.close()
-
-outputVarsF.close()
+# Returns the names that the variables in KvasirVarList have in
+# DfecPptMap, in the same order
+def KvasirVarKeys(KvasirVarList):
+    # If repType == "java.lang.String", then look
+    # up the entry for the variable + '[]' because
+    # Dfec has separate variables for the pointer
+    # and content of strings
+    return KvasirVarNames.ConvertAll([entry[0] + '[]' if entry[2] == "java.lang.String"
+                                      else entry[0]
+                                      for entry in KvasirVarList])
+
+# Returns the list of variables of the Kvasir program point ppt (with
+# the variable list KvasirVarList) that Dfec also has at the program
+# point with the key dfecKey (by default, the one that ppt's name
+# strips down to), or None if Dfec does not have the program point at
+# all.  The variables are matched up
+# by intersecting the set of Dfec variable names with the set of
+# (converted) Kvasir variable names.  If coverage (a CoverageReport) is
+# given, the sizes of the intersection and of both differences are
+# reported to it.
+def IntersectPpt(DfecPptMap, ppt, KvasirVarList, coverage=None, dfecKey=None):
+    if dfecKey is None:
+        dfecKey = StripKvasirPptName(ppt)
+    DfecVarMap = DfecPptMap.get(dfecKey)
+    if DfecVarMap is None:
+        if coverage is not None:
+            coverage.UnmatchedKvasirPpt(ppt)
+        return None
+
+    keys = KvasirVarKeys(KvasirVarList)
+    kvasirKeys = set(keys)
+    shared = DfecVarMap.viewkeys() & kvasirKeys
+
+    if coverage is not None:
+        coverage.Ppt(ppt, dfecKey, len(shared), len(DfecVarMap) - len(shared),
+                     len(kvasirKeys) - len(shared))
+
+    # Throw the comparability number on the end
+    # of the entry for each shared variable, in Kvasir's order
+
+    # Make this a tuple 'cause it should be immutable:
+    # Each entry should be the following:
+    #  (variable name, dec. type, rep. type,
+    #           (Lackwit comp. num, Kvasir comp. num, dec. type comp num)
+    curResultVarList = []
+    for (entry, key) in zip(KvasirVarList, keys):
+        if key in shared:
+            curResultVarList.append((entry[0], entry[1], entry[2],
+                                     (DfecVarMap[key], entry[3], entry[4])))
+            if DfecVarMap[key] == "":
+                print "EMPTY COMP. NUMBER!", entry[0], key
+
+    return curResultVarList
+
+# Writes a report of how well the Dfec and Kvasir .decls files match up
+# to out as JSON, one object per line:
+#  {"event": "ppt", "ppt": "..main():::ENTER", "shared": 10,
+#   "dfec_only": 2, "kvasir_only": 5}
+#    for each Kvasir program point that Dfec also has, with the numbers
+#    of variables that both, only Dfec or only Kvasir have there
+#  {"event": "unmatched", "side": "kvasir", "ppt": "..f():::EXIT0"}
+#    for each Kvasir program point that Dfec does not have
+#  {"event": "unmatched", "side": "dfec", "ppt": "g:::EXIT"}
+#    for each Dfec program point that no Kvasir program point matched,
+#    named by its stripped function name and ENTER or EXIT (which is
+#    what it is matched by)
+#  {"event": "summary", ...}
+#    with the totals of all of the above
+# The program point lines are written as the program points are
+# matched up, and the rest at the end.
+class CoverageReport(object):
+    def __init__(self, out):
+        self.out = out
+        # Keys of the Dfec program points that were matched
+        self.matchedDfecPpts = set()
+        self.totals = {'ppts_matched': 0, 'kvasir_ppts_unmatched': 0,
+                       'dfec_ppts_unmatched': 0, 'shared': 0,
+                       'dfec_only': 0, 'kvasir_only': 0}
+
+    def Emit(self, obj):
+        self.out.write(json.dumps(obj, sort_keys=True) + '\n')
+
+    # The ppt lines are formatted by hand since there can be hundreds of
+    # thousands of them, and json.dumps() is slow
+    PPT_FORMAT = ('{"dfec_only": %d, "event": "ppt", "kvasir_only": %d, '
+                  '"ppt": %s, "shared": %d}\n')
+
+    def Ppt(self, ppt, dfecKey, shared, dfecOnly, kvasirOnly):
+        self.matchedDfecPpts.add(dfecKey)
+        self.totals['ppts_matched'] += 1
+        self.totals['shared'] += shared
+        self.totals['dfec_only'] += dfecOnly
+        self.totals['kvasir_only'] += kvasirOnly
+        self.out.write(self.PPT_FORMAT % (dfecOnly, kvasirOnly,
+                                          encode_basestring_ascii(ppt), shared))
+
+    def UnmatchedKvasirPpt(self, ppt):
+        self.totals['kvasir_ppts_unmatched'] += 1
+        self.Emit({'event': 'unmatched', 'side': 'kvasir', 'ppt': ppt})
+
+    # Writes the Dfec program points that were never matched and the
+    # summary line
+    def Finish(self, DfecPptMap):
+        for dfecKey in sorted(DfecPptMap.viewkeys() - self.matchedDfecPpts):
+            self.totals['dfec_ppts_unmatched'] += 1
+            self.Emit({'event': 'unmatched', 'side': 'dfec',
+                       'ppt': dfecKey[0] + ':::' + dfecKey[1]})
+        summary = dict(self.totals)
+        summary['event'] = 'summary'
+        self.Emit(summary)
+
+
+# The comparability number that each .decls output gets for a variable,
+# as an index into the tuple of comparability numbers in the variable
+# lists from IntersectPpt(), or None for no comparability
+LACKWIT_COMP = 0
+DYNCOMP_COMP = 1
+DEC_TYPES_COMP = 2
+NO_COMP = None
+
+# Writes the resulting .decls files and the var list file one program
+# point at a time, as the matches are found.  Any of the output files
+# may be None, in which case that output is skipped.
+# The program point header and the name, declared type and rep. type
+# lines of each variable are the same in all of the .decls files, so
+# they are formatted once per program point and shared; each .decls
+# file then gets one write per program point.
+class ResultWriter(object):
+    def __init__(self, outputLackwitDeclsF, outputDynCompDeclsF,
+                 outputDecTypesDeclsF, outputNoCompDeclsF, outputVarsF):
+        # The .decls files that are in use, as (file, index of its
+        # comparability number) pairs
+        self.declsOutputs = [(f, comp) for (f, comp)
+                             in [(outputLackwitDeclsF, LACKWIT_COMP),
+                                 (outputDynCompDeclsF, DYNCOMP_COMP),
+                                 (outputDecTypesDeclsF, DEC_TYPES_COMP),
+                                 (outputNoCompDeclsF, NO_COMP)]
+                             if f is not None]
+        self.outputVarsF = outputVarsF
+
+        if outputNoCompDeclsF is not None:
+            outputNoCompDeclsF.write("VarComparability\nnone\n\n");
+
+    # Globals section ... let's just take the first program point and use
+    # the global vars in that one for the globals section.  This makes the
+    # assumption that the same global variables appear everywhere at all
+    # program points ... will have to investigate further later ...
+    # exampleVarList is the list of variables of the first program point
+    # in the Kvasir .decls file, or None if Dfec does not have it.
+    def WriteGlobals(self, exampleVarList):
+        if self.outputVarsF is None:
+            return
+
+        output = ["----SECTION----\n", "globals\n"]
+
+        for varEntry in exampleVarList or []:
+            if '/' in varEntry[0]: # only print out globals and file-statics
+                output.extend([varEntry[0], "\n"])
+
+        output.append("\n")
+        self.outputVarsF.write(''.join(output))
+
+    # Writes the program point to each of the .decls outputs
+    def WriteDecls(self, ppt, varList):
+        if self.declsOutputs:
+            header = "DECLARE\n" + ppt + "\n"
+
+            # Variable name, declared type and representation type
+            shared = [varEntry[0] + "\n" + varEntry[1] + "\n" + varEntry[2] + "\n"
+                      for varEntry in varList]
+
+            for (f, comp) in self.declsOutputs:
+                # Comparability number - this is where the action is!
+                # For Lackwit, we choose the car of the tuple,
+                # for DynComp, we choose the cadr,
+                # for dec. type, we choose the caddr,
+                # and for no comparability, simply print out '22'
+                if comp is NO_COMP:
+                    varLines = [varShared + "22\n" for varShared in shared]
+                else:
+                    varLines = [varShared + str(varEntry[3][comp]) + "\n"
+                                for (varShared, varEntry) in zip(shared, varList)]
+
+                # Newline separating neighboring program points
+                f.write(header + ''.join(varLines) + "\n")
+
+    # Writes the program point to the var list file
+    def WriteVars(self, ppt, varList):
+        # Only print the :::EXIT program point to the var list file
+        # because then we can grab the return value 'return'
+
+        # Remember that we need to print program points in the form of
+        # '..main()' and NOT '..main():::ENTER' and '..main():::EXIT0'
+        if self.outputVarsF is not None:
+            fnname, enterOrExit = ppt.split(':::')
+            if enterOrExit[:4] == "EXIT":
+                output = ["----SECTION----\n", fnname, "\n"]
+
+                # Don't print out globals or file-static vars in the
+                # var-list-file for individual program points
+                for varEntry in varList:
+                    if not ('/' in varEntry[0]):
+                        output.extend([varEntry[0], "\n"])
+
+                output.append("\n")
+                self.outputVarsF.write(''.join(output))
+
+
+# Reads the Dfec and Kvasir .decls files (paths or file objects) and
+# writes the 4 .decls files and the var list file to the given file
+# objects (any of which may be None to skip that output), and a
+# coverage report to coverageF if it is given (see CoverageReport).
+# Only the
+# Dfec .decls file is held in memory (as DfecPptMap); the Kvasir .decls
+# file is read one program point at a time, and each program point is
+# written out as soon as it has been matched up.  The parsed .decls
+# files are cached in cacheDir if it is given, and the time taken by
+# each phase and the numbers of matched and unmatched program points
+# and variables are added to stats (a daikon_stats.Stats) if it is
+# given.
+def DfecToKvasir(dfecDeclsF, kvasirDeclsF,
+                 outputLackwitDeclsF, outputDynCompDeclsF,
+                 outputDecTypesDeclsF, outputNoCompDeclsF, outputVarsF,
+                 cacheDir=None, stats=None, coverageF=None, exits='last'):
+    with TimePhase(stats, 'dfec decls parse'):
+        DfecPptMap = ReadDfecDecls(dfecDeclsF, cacheDir, exits)
+
+    exitMap = None
+    if exits == 'all':
+        exitMap = IndexExits(DfecPptMap)
+
+    coverage = None
+    if coverageF is not None:
+        coverage = CoverageReport(coverageF)
+
+    writer = ResultWriter(outputLackwitDeclsF, outputDynCompDeclsF,
+                          outputDecTypesDeclsF, outputNoCompDeclsF, outputVarsF)
+
+    # Counters for stats; the times are only taken if it is in use.
+    # time.clock() is the CPU time of this process.
+    timed = stats is not None
+    timer = time.time
+    clock = time.clock
+    numMatchedPpts = numKvasirVars = numMatchedVars = 0
+    # (With the 'all' exit policy, one Kvasir program point can match
+    # several Dfec ones)
+    numUnmatchedKvasirPpts = 0
+    # Keys of the Dfec program points that were matched
+    matchedDfecPpts = set()
+    readTime = matchTime = writeTime = 0.0
+    readCpu = matchCpu = writeCpu = 0.0
+    if timed:
+        lastEnd = timer()
+        lastEndCpu = clock()
+
+    isFirst = True
+    for (ppt, KvasirVarList) in ReadKvasirPpts(kvasirDeclsF, cacheDir):
+        if timed:
+            matchStart = timer()
+            matchStartCpu = clock()
+            readTime += matchStart - lastEnd
+            readCpu += matchStartCpu - lastEndCpu
+
+        # (A Kvasir program point with no match still goes through
+        # IntersectPpt(), so that the coverage report lists it)
+        results = [(name, dfecKey,
+                    IntersectPpt(DfecPptMap, name, KvasirVarList, coverage, dfecKey))
+                   for (name, dfecKey)
+                   in MatchPpt(DfecPptMap, ppt, exitMap) or [(ppt, None)]]
+
+        if timed:
+            writeStart = timer()
+            writeStartCpu = clock()
+            matchTime += writeStart - matchStart
+            matchCpu += writeStartCpu - matchStartCpu
+            if results[0][2] is None:
+                numUnmatchedKvasirPpts += 1
+            for (name, dfecKey, curResultVarList) in results:
+                if curResultVarList is not None:
+                    numMatchedPpts += 1
+                    numKvasirVars += len(KvasirVarList)
+                    numMatchedVars += len(curResultVarList)
+                    matchedDfecPpts.add(dfecKey)
+
+        if isFirst:
+            writer.WriteGlobals(results[0][2])
+            isFirst = False
+        if len(results) == 1:
+            name, dfecKey, curResultVarList = results[0]
+            if curResultVarList is not None:
+                writer.WriteDecls(name, curResultVarList)
+                writer.WriteVars(ppt, curResultVarList)
+        else:
+            # One .decls program point per Dfec exit, but only one
+            # var list section for the function, with the variables
+            # of any of them
+            varNames = set()
+            for (name, dfecKey, curResultVarList) in results:
+                writer.WriteDecls(name, curResultVarList)
+                varNames.update([varEntry[0] for varEntry in curResultVarList])
+            writer.WriteVars(ppt, [entry for entry in KvasirVarList
+                                   if entry[0] in varNames])
+
+        if timed:
+            lastEnd = timer()
+            lastEndCpu = clock()
+            writeTime += lastEnd - writeStart
+            writeCpu += lastEndCpu - writeStartCpu
+
+    if coverage is not None:
+        coverage.Finish(DfecPptMap)
+
+    if timed:
+        stats.AddTime('kvasir decls parse', readTime, readCpu)
+        stats.AddTime('matching', matchTime, matchCpu)
+        stats.AddTime('output', writeTime, writeCpu)
+
+        # A Kvasir variable at a matched program point that Dfec has no
+        # variable for is left out of the outputs
+        stats.Count('ppts_matched', numMatchedPpts)
+        stats.Count('kvasir_ppts_unmatched', numUnmatchedKvasirPpts)
+        stats.Count('dfec_ppts_unmatched', len(DfecPptMap) - len(matchedDfecPpts))
+        stats.Count('vars_matched', numMatchedVars)
+        stats.Count('vars_dropped', numKvasirVars - numMatchedVars)
+        CountNameCaches(stats)
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(usage="dfec-to-kvasir.py [--stats FILE] [--coverage FILE] [--exits POLICY] dfec-produced.decls kvasir-produced.decls (kvasir-with-lackwit.decls kvasir-with-dyncomp.decls kvasir-with-declared-types.decls kvasir-no-comp.decls intersection.vars | [--lackwit FILE] [--dyncomp FILE] [--dec-types FILE] [--no-comp FILE] [--vars FILE])")
+    parser.add_argument('dfecDeclsFile')
+    parser.add_argument('kvasirDeclsFile')
+    parser.add_argument('outputFiles', nargs='*')
+    outputNames = ['lackwit', 'dyncomp', 'dec_types', 'no_comp', 'vars']
+    parser.add_argument('--lackwit', metavar='FILE',
+                        help="write the .decls file with Lackwit comparability to FILE")
+    parser.add_argument('--dyncomp', metavar='FILE',
+                        help="write the .decls file with DynComp comparability to FILE")
+    parser.add_argument('--dec-types', metavar='FILE',
+                        help="write the .decls file with declared type comparability to FILE")
+    parser.add_argument('--no-comp', metavar='FILE',
+                        help="write the .decls file with no comparability to FILE")
+    parser.add_argument('--vars', metavar='FILE',
+                        help="write the var list file to FILE")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="write timing numbers and match counts as JSON to FILE ('-' for stderr)")
+    parser.add_argument('--coverage', metavar='FILE',
+                        help="write a coverage report as JSON to FILE ('-' for stderr)")
+    parser.add_argument('--exits', choices=EXIT_POLICIES, default='last',
+                        help="how to match Dfec's numbered exits with Kvasir's EXIT0: keep the last or the first one, merge their variables, or write all of them (default: last)")
+    args = parser.parse_args(argv[1:])
+
+    names = [getattr(args, name) for name in outputNames]
+    if args.outputFiles:
+        if len(args.outputFiles) != len(outputNames) or names != [None] * len(outputNames):
+            parser.error("give either all 5 output files or the options for the ones you want")
+        names = args.outputFiles
+    elif names == [None] * len(outputNames):
+        parser.error("no output files given")
+
+    stats = OpenStats(args.stats)
+
+    # Process command-line args:
+    # (Any of these ending in .gz, .bz2 or .xz get compressed)
+    outputFiles = [name and CreateFile(name) for name in names]
+
+    coverageF = None
+    if args.coverage == '-':
+        coverageF = sys.stderr
+    elif args.coverage is not None:
+        coverageF = CreateFile(args.coverage)
+
+    DfecToKvasir(args.dfecDeclsFile, args.kvasirDeclsFile, *outputFiles,
+                 cacheDir=DefaultCacheDir(), stats=stats, coverageF=coverageF,
+                 exits=args.exits)
+
+    for f in outputFiles:
+        if f is not None:
+            f.close()
+    if coverageF is not None and coverageF is not sys.stderr:
+        coverageF.close()
+    CloseStats(stats)
+
+if __name__ == '__main__':
+    main(sys.argv)
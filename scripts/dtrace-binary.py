@@ -0,0 +1,510 @@
+#!/usr/bin/python
+
+# Converts .dtrace files between Daikon's ASCII format and the compact
+# binary format proposed in doc/todo-daikon-binary-format.txt, in
+# either direction.  Converting ASCII -> binary -> ASCII gives back a
+# file that is identical to the original, byte for byte.
+
+# Usage: ./dtrace-binary.py [--output FILE] input
+#        ./dtrace-binary.py --report input.dtrace
+# If input is a binary trace, it is converted to ASCII, and otherwise
+# it is converted from ASCII to binary.  Output is written to stdout by
+# default.  Either may be compressed with gzip, bzip2 or xz (see
+# daikon_io.py).
+# --report converts an ASCII trace to binary and back in a temporary
+# directory, checks that the round trip is exact, and prints the sizes
+# of and the times to read the ASCII, gzipped ASCII, binary and gzipped
+# binary versions.
+
+# From Python, load this with daikon_io.LoadScript('dtrace-binary') and
+# call EncodeTrace(), DecodeTrace() or ReadBinaryTrace().
+
+# The binary format:
+#
+# The file starts with the magic line "DAIKON-BINARY-TRACE 1\n", which
+# is followed by chunks, each of which starts with a one-byte tag:
+#
+#  'T' text:   string
+#      ASCII text that is copied to the output as is.  The header,
+#      declarations, comments and anything else that isn't a sample
+#      are kept this way, so the file switches between the declaration
+#      parts and the sample parts with each chunk.
+#
+#  'P' program point layout:   string, byte, varint n, n strings
+#      The name line of a program point, 1 if its samples have a
+#      this_invocation_nonce (else 0), and the names of its variables
+#      in the order that they appear.  Layouts are numbered from 0 in
+#      the order that they appear in the file, and each one comes
+#      before its first sample.  A program point whose samples don't
+#      always list the same variables gets a layout for each list.
+#
+#  'S' sample:   uint32 layout number, [nonce value], one value per variable
+#      The program point name, nonce name and variable names are given
+#      by the layout, so only the values are stored.
+#
+# A string is a varint length followed by that many bytes.  Varints are
+# unsigned LEB128 (7 bits per byte, low bits first), and all other
+# numbers are little-endian.
+#
+# A value starts with a byte holding (kind << 2) | modbit, where modbit
+# 0, 1 or 2 is the modified bit of the variable and 3 means that the
+# modified line is not one of those and follows the value as a string.
+# (The nonce value always has a modbit of 0.)  The kinds are:
+#
+#   0 string       a string holding the value line as is
+#   1 int8         a number that fits in a signed byte
+#   2 int32        a number that fits in 4 bytes
+#   3 int64        a number that fits in 8 bytes
+#   4 nonsensical  no data follows
+#   5 null         no data follows
+#   6 uninit       no data follows
+#   7 int array    varint n, then n int32s; e.g. '[1 -2 3]'
+#
+# Numbers are only stored in binary if printing them back out gives
+# the exact same line (so '007', '+1' and '1.0' are stored as strings).
+# Records are only stored as samples if their lines are a program
+# point name, an optional this_invocation_nonce and value, and triples
+# of name, value and modbit, with one blank line after them.  Anything
+# else is stored as text, which is what makes the round trip exact.
+#
+# The format does not compress anything itself; compress the files
+# with an external tool (or give --output a .gz name) for that.
+
+import sys
+import os
+import struct
+import itertools
+from daikon_io import (ReadBlocks, ExactRecords, MapFile, MappedRecords,
+                       OpenOutput, CreateFile)
+from daikon_format import ReadDtrace, IsSamplePptName, NONCE_NAME
+
+MAGIC = b'DAIKON-BINARY-TRACE 1\n'
+
+TEXT_TAG = b'T'
+LAYOUT_TAG = b'P'
+SAMPLE_TAG = b'S'
+
+(STRING_KIND, INT8_KIND, INT32_KIND, INT64_KIND, NONSENSICAL_KIND,
+ NULL_KIND, UNINIT_KIND, INT_ARRAY_KIND) = range(8)
+
+# Key: value line, Value: its kind, for values with no data
+CONSTANT_KINDS = {'nonsensical': NONSENSICAL_KIND,
+                  'null': NULL_KIND,
+                  'uninit': UNINIT_KIND}
+CONSTANT_VALUES = dict([(kind, value)
+                        for (value, kind) in CONSTANT_KINDS.items()])
+
+# Key: modified line, Value: its modbit
+MODBITS = {'0': 0, '1': 1, '2': 2}
+MODBIT_LINES = ['0', '1', '2']
+OTHER_MODBIT = 3
+
+INT8 = struct.Struct('<b')
+INT32 = struct.Struct('<i')
+INT64 = struct.Struct('<q')
+UINT32 = struct.Struct('<I')
+
+INT_START = frozenset('-0123456789')
+
+
+def EncodeVarint(n):
+    out = []
+    while n >= 0x80:
+        out.append(chr((n & 0x7f) | 0x80))
+        n >>= 7
+    out.append(chr(n))
+    return ''.join(out)
+
+def EncodeString(s):
+    return EncodeVarint(len(s)) + s
+
+# Returns a number for the value line value if it is one that prints
+# back out as exactly that line, or else None
+def ExactInt(value):
+    if value[:1] not in INT_START:
+        return None
+    try:
+        n = int(value)
+    except ValueError:
+        return None
+    if str(n) != value:
+        return None
+    return n
+
+# Returns a pair of (kind, encoded data) for the value line value
+def EncodeData(value):
+    kind = CONSTANT_KINDS.get(value)
+    if kind is not None:
+        return (kind, '')
+
+    n = ExactInt(value)
+    if n is not None:
+        if -0x80 <= n < 0x80:
+            return (INT8_KIND, INT8.pack(n))
+        elif -0x80000000 <= n < 0x80000000:
+            return (INT32_KIND, INT32.pack(n))
+        elif -0x8000000000000000 <= n < 0x8000000000000000:
+            return (INT64_KIND, INT64.pack(n))
+
+    elif value[:1] == '[' and value[-1:] == ']':
+        if value == '[]':
+            return (INT_ARRAY_KIND, EncodeVarint(0))
+        nums = [ExactInt(item) for item in value[1:-1].split(' ')]
+        if (None not in nums and
+            min(nums) >= -0x80000000 and max(nums) < 0x80000000):
+            return (INT_ARRAY_KIND,
+                    EncodeVarint(len(nums)) +
+                    struct.pack('<%di' % len(nums), *nums))
+
+    return (STRING_KIND, EncodeString(value))
+
+# Encodings of recently seen value lines, since most traces repeat the
+# same few values over and over.  It is cleared whenever it gets to
+# MAX_CACHED_VALUES entries.
+MAX_CACHED_VALUES = 100000
+encodedValues = {}
+
+def EncodeValue(value, modLine):
+    data = encodedValues.get(value)
+    if data is None:
+        if len(encodedValues) >= MAX_CACHED_VALUES:
+            encodedValues.clear()
+        kind, data = EncodeData(value)
+        data = (kind << 2, data)
+        encodedValues[value] = data
+
+    modbit = MODBITS.get(modLine, OTHER_MODBIT)
+    if modbit == OTHER_MODBIT:
+        return chr(data[0] | modbit) + data[1] + EncodeString(modLine)
+    else:
+        return chr(data[0] | modbit) + data[1]
+
+# Returns (program point name line, has nonce, index of the first
+# variable) if the record (a list of lines) can be stored as a sample,
+# or else None
+def SampleShape(record):
+    pptLine = record[0]
+    if not IsSamplePptName(pptLine) or pptLine[:4] == 'ppt ':
+        return None
+
+    first = 1
+    hasNonce = len(record) >= 3 and record[1] == NONCE_NAME
+    if hasNonce:
+        first = 3
+    if (len(record) - first) % 3 != 0:
+        return None
+    return (pptLine, hasNonce, first)
+
+# Converts the ASCII .dtrace file read from blocks (see
+# daikon_io.ReadBlocks()) to binary and writes it to out
+def EncodeTrace(blocks, out):
+    out.write(MAGIC)
+
+    # Key: (program point name line, has nonce, tuple of variable names)
+    # Value: its layout number
+    layouts = {}
+
+    # Text waiting to go out in the next 'T' chunk
+    text = []
+
+    for (record, gap) in ExactRecords(blocks):
+        shape = None
+        if record is not None:
+            shape = SampleShape(record)
+        if shape is None:
+            if record is None:
+                text.append(gap)
+            else:
+                text.append('\n'.join(record) + '\n\n')
+            continue
+
+        if text:
+            out.write(TEXT_TAG + EncodeString(''.join(text)))
+            text = []
+
+        pptLine, hasNonce, first = shape
+        key = (pptLine, hasNonce, tuple(record[first::3]))
+        layout = layouts.get(key)
+        if layout is None:
+            layout = len(layouts)
+            layouts[key] = layout
+            out.write(LAYOUT_TAG + EncodeString(pptLine) +
+                      chr(hasNonce) + EncodeVarint(len(key[2])) +
+                      ''.join([EncodeString(name) for name in key[2]]))
+
+        output = [SAMPLE_TAG, UINT32.pack(layout)]
+        if hasNonce:
+            output.append(EncodeValue(record[2], '0'))
+        for i in range(first, len(record), 3):
+            output.append(EncodeValue(record[i+1], record[i+2]))
+        out.write(''.join(output))
+
+    if text:
+        out.write(TEXT_TAG + EncodeString(''.join(text)))
+
+
+def DecodeVarint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = ord(data[pos])
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (n, pos)
+        shift += 7
+
+def DecodeString(data, pos):
+    n, pos = DecodeVarint(data, pos)
+    return (data[pos:pos+n], pos + n)
+
+# Returns (value line, modified line, position after them) for the
+# value at position pos of data
+def DecodeValue(data, pos):
+    tag = ord(data[pos])
+    pos += 1
+    kind = tag >> 2
+
+    if kind == STRING_KIND:
+        value, pos = DecodeString(data, pos)
+    elif kind == INT8_KIND:
+        value = str(INT8.unpack_from(data, pos)[0])
+        pos += 1
+    elif kind == INT32_KIND:
+        value = str(INT32.unpack_from(data, pos)[0])
+        pos += 4
+    elif kind == INT64_KIND:
+        value = str(INT64.unpack_from(data, pos)[0])
+        pos += 8
+    elif kind == INT_ARRAY_KIND:
+        n, pos = DecodeVarint(data, pos)
+        nums = struct.unpack_from('<%di' % n, data, pos)
+        value = '[' + ' '.join([str(num) for num in nums]) + ']'
+        pos += 4 * n
+    elif kind in CONSTANT_VALUES:
+        value = CONSTANT_VALUES[kind]
+    else:
+        raise ValueError("unknown value kind %d at byte %d" % (kind, pos - 1))
+
+    modbit = tag & 3
+    if modbit == OTHER_MODBIT:
+        modLine, pos = DecodeString(data, pos)
+    else:
+        modLine = MODBIT_LINES[modbit]
+
+    return (value, modLine, pos)
+
+# Yields the contents of a binary trace (a string or memory map holding
+# the whole file) in order.  Each text chunk is yielded as a string,
+# and each sample as a tuple of
+#  (program point name line, nonce value or None,
+#   [(variable name, value line, modified line), ...])
+def ReadBinaryTrace(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a binary trace")
+
+    # Each element is (program point name line, has nonce, variable names)
+    layouts = []
+
+    pos = len(MAGIC)
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+
+        if tag == TEXT_TAG:
+            text, pos = DecodeString(data, pos)
+            yield text
+
+        elif tag == LAYOUT_TAG:
+            pptLine, pos = DecodeString(data, pos)
+            hasNonce = data[pos] != '\0'
+            numVars, pos = DecodeVarint(data, pos + 1)
+            names = []
+            for i in range(numVars):
+                name, pos = DecodeString(data, pos)
+                names.append(name)
+            layouts.append((pptLine, hasNonce, names))
+
+        elif tag == SAMPLE_TAG:
+            pptLine, hasNonce, names = layouts[UINT32.unpack_from(data, pos)[0]]
+            pos += 4
+
+            nonce = None
+            if hasNonce:
+                nonce, modLine, pos = DecodeValue(data, pos)
+
+            varValues = []
+            for name in names:
+                value, modLine, pos = DecodeValue(data, pos)
+                varValues.append((name, value, modLine))
+            yield (pptLine, nonce, varValues)
+
+        else:
+            raise ValueError("unknown chunk tag %r at byte %d" % (tag, pos - 1))
+
+# Converts a binary trace (a string or memory map holding the whole
+# file) back to ASCII and writes it to out
+def DecodeTrace(data, out):
+    for item in ReadBinaryTrace(data):
+        if isinstance(item, str):
+            out.write(item)
+            continue
+
+        pptLine, nonce, varValues = item
+        output = [pptLine, '\n']
+        if nonce is not None:
+            output.extend([NONCE_NAME, '\n', nonce, '\n'])
+        for (name, value, modLine) in varValues:
+            output.extend([name, '\n', value, '\n', modLine, '\n'])
+        output.append('\n')
+        out.write(''.join(output))
+
+# Returns the contents of the file f (a path or a file object) as a
+# string or memory map
+def ReadWhole(f):
+    data = MapFile(f)
+    if data is None:
+        data = b''.join(ReadBlocks(f))
+    return data
+
+# Converts the .dtrace file f (a path or a file object) from binary to
+# ASCII if it is binary, or else from ASCII to binary, and writes the
+# result to out
+def ConvertTrace(f, out):
+    data = MapFile(f)
+    if data is not None:
+        if data[:len(MAGIC)] == MAGIC:
+            DecodeTrace(data, out)
+        else:
+            data.close()
+            EncodeTrace(ReadBlocks(f), out)
+        return
+
+    # Look at the start of the (decompressed) file without losing it
+    blocks = ReadBlocks(f)
+    first = next(blocks, b'')
+    if first[:len(MAGIC)] == MAGIC:
+        DecodeTrace(b''.join(itertools.chain([first], blocks)), out)
+    else:
+        EncodeTrace(itertools.chain([first], blocks), out)
+
+
+# A file object that throws away everything written to it, for timing
+class NullWriter(object):
+    def write(self, s):
+        pass
+
+def Seconds(work):
+    start = os.times()
+    work()
+    end = os.times()
+    # User + system time, so that waiting on the disk doesn't count
+    return (end[0] + end[1]) - (start[0] + start[1])
+
+# Reads every sample of an ASCII trace, splitting it into variables
+def ReadAscii(path):
+    for (pptName, nonce, fields) in ReadDtrace(MappedRecords(path)):
+        [(fields[i], fields[i+1], fields[i+2])
+         for i in range(0, len(fields) - 2, 3)]
+
+def ReadBinary(path):
+    for item in ReadBinaryTrace(ReadWhole(path)):
+        pass
+
+# Prints the sizes of and the times to convert and read the ASCII
+# trace at path in each format to out.  Returns True if the round trip
+# gave back the original file.
+def Report(path, out):
+    import tempfile
+    import shutil
+    import hashlib
+
+    tmpDir = tempfile.mkdtemp(prefix='dtrace-binary-')
+    try:
+        base = os.path.join(tmpDir, 'trace')
+        files = [('ASCII', path),
+                 ('ASCII (gzip)', base + '.dtrace.gz'),
+                 ('binary', base + '.dtb'),
+                 ('binary (gzip)', base + '.dtb.gz')]
+
+        def Copy(src, dest):
+            outFile = CreateFile(dest)
+            for block in ReadBlocks(src):
+                outFile.write(block)
+            outFile.close()
+
+        def Encode(dest):
+            outFile = OpenOutput(dest)
+            EncodeTrace(ReadBlocks(path), outFile)
+            outFile.close()
+
+        times = {}
+        times['ASCII (gzip)'] = Seconds(lambda: Copy(path, files[1][1]))
+        times['binary'] = Seconds(lambda: Encode(files[2][1]))
+        times['binary (gzip)'] = Seconds(lambda: Encode(files[3][1]))
+
+        # Check the round trip
+        roundTrip = base + '.round-trip.dtrace'
+        def Decode():
+            outFile = OpenOutput(roundTrip)
+            ConvertTrace(files[2][1], outFile)
+            outFile.close()
+        decodeTime = Seconds(Decode)
+        def Digest(f):
+            md5 = hashlib.md5()
+            for block in ReadBlocks(f):
+                md5.update(block)
+            return md5.digest()
+        identical = Digest(path) == Digest(roundTrip)
+        os.remove(roundTrip)
+
+        out.write('%-15s %12s %8s %10s %10s\n'
+                  % ('format', 'bytes', 'ratio', 'write (s)', 'read (s)'))
+        asciiSize = os.path.getsize(path)
+        for (name, f) in files:
+            if name.startswith('ASCII'):
+                readTime = Seconds(lambda: ReadAscii(f))
+            else:
+                readTime = Seconds(lambda: ReadBinary(f))
+            size = os.path.getsize(f)
+            if name in times:
+                writeTime = '%10.2f' % times[name]
+            else:
+                writeTime = '%10s' % '-'
+            out.write('%-15s %12d %8.3f %s %10.2f\n'
+                      % (name, size, float(size) / max(asciiSize, 1),
+                         writeTime, readTime))
+
+        out.write('binary -> ASCII: %.2f s\n' % decodeTime)
+        if identical:
+            out.write('round trip: identical\n')
+        else:
+            out.write('round trip: DIFFERENT\n')
+        return identical
+    finally:
+        shutil.rmtree(tmpDir)
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(usage="dtrace-binary.py [--output FILE | --report] dtrace-file")
+    parser.add_argument('dtraceFile')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help="write the converted trace to FILE instead of stdout")
+    parser.add_argument('--report', action='store_true',
+                        help="compare the sizes and read times of the formats")
+    args = parser.parse_args(argv[1:])
+
+    if args.report:
+        if not Report(args.dtraceFile, sys.stdout):
+            return 1
+        return 0
+
+    out = OpenOutput(args.output)
+    ConvertTrace(args.dtraceFile, out)
+    out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+
+# Builds and uses a byte-offset index of a .dtrace file, so that the
+# records of a few program points can be read without scanning the
+# whole trace.
+
+# Usage: ./dtrace-index.py build <.dtrace file> ...
+#        ./dtrace-index.py list <.dtrace file>
+#        ./dtrace-index.py extract [--output FILE] <.dtrace file> <ppt name> ...
+# build writes (or brings up to date) the index of each file in a
+# sidecar file named after it with .idx added (e.g. foo.dtrace.idx).
+# list prints the number of records of each program point.
+# extract writes the records of the given program points, in file
+# order, to FILE (or stdout).
+# list and extract build or update the index first if needed.
+
+# The index maps each program point name (the stripped line that names
+# an :::ENTER or :::EXIT program point, as read by
+# daikon_format.ReadDtrace()) to the byte offsets and lengths of its
+# records.  A record's bytes run from its first line through the blank
+# line that ends it.  Records without a program point name (such as
+# the header and any declarations) are not indexed, and neither is a
+# last record that has no blank line after it yet.
+
+# The index remembers how much of the file it covers, along with
+# digests of the first and the last few KB of that part.  If those
+# bytes are unchanged the file has at most been appended to, so only
+# the new part is scanned; otherwise the whole file is indexed again.
+
+# Only uncompressed regular files can be indexed, since reading a
+# record at an offset needs random access.
+
+# From Python, load this with daikon_io.LoadScript('dtrace-index') and
+# call LoadIndex() and IndexedRecords().
+
+import sys
+import os
+import marshal
+import hashlib
+from daikon_io import (MapFile, IsSplittable, OpenOutput,
+                       RECORD_END_RE, BLANK_LINES_RE)
+from daikon_format import IsSamplePptName, PPT_START
+
+INDEX_VERSION = "dtrace-index-1"
+INDEX_SUFFIX = '.idx'
+
+# How many bytes at each end of the indexed part are digested to check
+# that it did not change
+CHECK_SIZE = 4096
+
+# Returns True if the stripped line names the program point of a
+# record (rather than starting a decls 2.0 declaration in the trace)
+def IsRecordPptName(line):
+    return IsSamplePptName(line) and line[0:len(PPT_START)] != PPT_START
+
+def IndexPath(path):
+    return path + INDEX_SUFFIX
+
+def CheckDigests(mm, indexedEnd):
+    head = mm[:min(CHECK_SIZE, indexedEnd)]
+    tail = mm[max(0, indexedEnd - CHECK_SIZE):indexedEnd]
+    return (hashlib.md5(head).hexdigest(), hashlib.md5(tail).hexdigest())
+
+# Adds the records of mm (a memory-mapped .dtrace file) from offset pos
+# on to entries, a map from program point name to a pair of lists
+# (offsets, lengths).  Returns the offset just past the last complete
+# record.
+def ScanRecords(mm, pos, entries):
+    end = len(mm)
+    find = mm.find
+    while True:
+        pos = BLANK_LINES_RE.match(mm, pos, end).end()
+        if pos >= end:
+            break
+        recordEnd = RECORD_END_RE.search(mm, pos, end)
+        if recordEnd is None:
+            # The last record isn't finished
+            break
+        recordEnd = recordEnd.end()
+
+        # The program point name is nearly always the first line
+        lineEnd = find(b'\n', pos, recordEnd)
+        pptName = mm[pos:lineEnd].strip()
+        if not IsRecordPptName(pptName):
+            pptName = None
+            for line in mm[lineEnd + 1:recordEnd].split(b'\n'):
+                line = line.strip()
+                if IsRecordPptName(line):
+                    pptName = line
+                    break
+
+        if pptName is not None:
+            entry = entries.get(pptName)
+            if entry is None:
+                entry = entries[pptName] = ([], [])
+            entry[0].append(pos)
+            entry[1].append(recordEnd - pos)
+
+        pos = recordEnd
+
+    return pos
+
+# Returns the contents of the index file at path, or None if it is
+# missing, unreadable or from another version of this script
+def ReadIndexFile(path):
+    try:
+        f = open(path, 'rb')
+        try:
+            index = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(index, tuple) or len(index) != 4 or index[0] != INDEX_VERSION:
+        return None
+    return index
+
+def WriteIndexFile(path, index):
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        f = open(tmpPath, 'wb')
+        try:
+            marshal.dump(index, f)
+        finally:
+            f.close()
+        os.rename(tmpPath, path)
+    except (IOError, OSError):
+        # The index is only an optimization, so it's fine if the
+        # directory is read-only
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+# Returns the index of the .dtrace file at path, a map from program
+# point name to a pair of lists (offsets, lengths) of its records in
+# file order.  The index file is read if it is up to date, updated if
+# the .dtrace file was appended to, and rebuilt otherwise.  If save is
+# False the index file is never written.
+def LoadIndex(path, save=True):
+    if not IsSplittable(path):
+        raise ValueError("%s can't be indexed because it isn't an uncompressed regular file" % path)
+
+    mm = MapFile(path)
+    if mm is None:
+        # (An empty file can't be mapped, and has no records)
+        return {}
+
+    try:
+        indexPath = IndexPath(path)
+        index = ReadIndexFile(indexPath)
+        if index is not None:
+            indexedEnd, digests, entries = index[1:]
+            if indexedEnd > len(mm) or CheckDigests(mm, indexedEnd) != digests:
+                index = None
+
+        if index is None:
+            indexedEnd = 0
+            entries = {}
+
+        if indexedEnd < len(mm):
+            newEnd = ScanRecords(mm, indexedEnd, entries)
+            if save and (index is None or newEnd != indexedEnd):
+                WriteIndexFile(indexPath, (INDEX_VERSION, newEnd,
+                                           CheckDigests(mm, newEnd), entries))
+    finally:
+        mm.close()
+
+    return entries
+
+# Yields the records of the program points named in pptNames from the
+# .dtrace file at path in file order, using its index (as returned by
+# LoadIndex()).  Each record is a list of its lines, like the records
+# of daikon_io.MappedRecords().
+def IndexedRecords(path, index, pptNames):
+    for data in IndexedData(path, index, pptNames):
+        # Drop the blank line at the end
+        yield data.split(b'\n')[:-2]
+
+# Like IndexedRecords(), but yields the bytes of each record, which end
+# with a blank line
+def IndexedData(path, index, pptNames):
+    spans = []
+    for pptName in pptNames:
+        entry = index.get(pptName)
+        if entry is not None:
+            spans.extend(zip(entry[0], entry[1]))
+    if not spans:
+        return
+    spans.sort()
+
+    mm = MapFile(path)
+    try:
+        for (offset, length) in spans:
+            yield mm[offset:offset + length]
+    finally:
+        mm.close()
+
+
+# Writes the records of the program points in pptNames from the .dtrace
+# file at path to out, in file order
+def ExtractRecords(path, pptNames, out):
+    index = LoadIndex(path)
+    for data in IndexedData(path, index, pptNames):
+        out.write(data)
+
+# Writes the number of records of each program point in the .dtrace
+# file at path to out
+def ListPpts(path, out):
+    index = LoadIndex(path)
+    for pptName in sorted(index):
+        out.write('%d %s\n' % (len(index[pptName][0]), pptName))
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(usage="dtrace-index.py build dtrace-file ... | list dtrace-file | extract [--output FILE] dtrace-file ppt-name ...")
+    commands = parser.add_subparsers(dest='command')
+
+    build = commands.add_parser('build', help="build or update the index of each file")
+    build.add_argument('dtraceFiles', nargs='+')
+
+    listPpts = commands.add_parser('list', help="print the number of records of each program point")
+    listPpts.add_argument('dtraceFile')
+
+    extract = commands.add_parser('extract', help="write the records of the given program points")
+    extract.add_argument('dtraceFile')
+    extract.add_argument('pptNames', nargs='+')
+    extract.add_argument('-o', '--output', metavar='FILE',
+                         help="write the records to FILE instead of stdout")
+    args = parser.parse_args(argv[1:])
+
+    paths = getattr(args, 'dtraceFiles', None) or [args.dtraceFile]
+    for path in paths:
+        if not IsSplittable(path):
+            parser.error("%s can't be indexed because it isn't an uncompressed regular file" % path)
+
+    if args.command == 'build':
+        for path in paths:
+            LoadIndex(path)
+    elif args.command == 'list':
+        ListPpts(args.dtraceFile, sys.stdout)
+    else:
+        out = OpenOutput(args.output)
+        ExtractRecords(args.dtraceFile, args.pptNames, out)
+        out.close()
+
+if __name__ == '__main__':
+    main(sys.argv)